@@ -15,6 +15,14 @@ __config__ = {
     "enable_cache": True,
     "cache_length": None,
     "max_cache_space": None,
+    "cache_path": None,
+    "max_cache_path_space": None,
+    "cache_warmup": True,
+    "cache_prefetch_threshold": None,
+    "cache_report_path": None,
+    "cache_shared_memory": False,
+    "max_memo_space": None,
+    "max_concurrent_requests": 16,
     # other
     "fps": 60,
     "persist_path": ".persist",
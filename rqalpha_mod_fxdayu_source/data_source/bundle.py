@@ -1,4 +1,7 @@
 # encoding: utf-8
+from collections import OrderedDict
+
+import numpy as np
 
 from rqalpha_mod_fxdayu_source.data_source.common import CacheMixin
 from rqalpha_mod_fxdayu_source.data_source.common.odd import OddFrequencyBaseDataSource
@@ -13,9 +16,9 @@ class BundleDataSource(OddFrequencyBaseDataSource):
         super(BundleDataSource, self).__init__(path)
         self._bundle_reader = AStockBcolzMinuteBarReader(bundle_path)
 
-    def raw_history_bars(self, instrument, frequency, start_dt=None, end_dt=None, length=None):
+    def raw_history_bars(self, instrument, frequency, start_dt=None, end_dt=None, length=None, fields=None):
         sid = instrument.order_book_id
-        data = self._bundle_reader.raw_history_bars(sid, start_dt, end_dt, length)
+        data = self._bundle_reader.raw_history_bars(sid, start_dt, end_dt, length, fields=fields)
         return data
 
     def available_data_range(self, frequency):
@@ -24,6 +27,30 @@ class BundleDataSource(OddFrequencyBaseDataSource):
     def is_base_frequency(self, instrument, freq):
         return freq in ["1m"]
 
+    def history_bars_panel(self, instruments, bar_count, frequency, fields, dt,
+                           skip_suspended=True, include_now=False,
+                           adjust_type='pre', adjust_orig=None):
+        """
+        Minute bars are read from bundles for all instruments at once and aligned with the trading minutes,
+        so bars of suspended minutes are filled with nan regardless of skip_suspended.
+        """
+        if frequency != "1m":
+            return super(BundleDataSource, self).history_bars_panel(
+                instruments, bar_count, frequency, fields, dt, skip_suspended=skip_suspended,
+                include_now=include_now, adjust_type=adjust_type, adjust_orig=adjust_orig
+            )
+        fields = self._get_panel_fields(fields)
+        datetimes, arrays = self._bundle_reader.load_raw_arrays_before(
+            [instrument.order_book_id for instrument in instruments], dt, bar_count, fields
+        )
+        panel = OrderedDict([("datetime", datetimes)])
+        for field, array in zip(fields, arrays):
+            panel[field] = array.astype(np.float64)
+        if "volume" in panel:
+            # prices of the minutes without bars are read as nan while their volumes are 0
+            panel["volume"][panel["volume"] == 0] = np.nan
+        return self._adjust_panel(instruments, panel, adjust_type, adjust_orig)
+
 
 class BundleCacheDataSource(BundleDataSource, CacheMixin):
     def __init__(self, path, bundle_path):
@@ -1,5 +1,6 @@
 from .cache import CacheMixin
+from .minite import MiniteBarDataSourceMixin
 from .odd import OddFrequencyDataSource, OddFrequencyBaseDataSource, CompleteAbstractDataSource
 
-__all__ = ["CacheMixin", "OddFrequencyDataSource", "OddFrequencyBaseDataSource",
+__all__ = ["CacheMixin", "MiniteBarDataSourceMixin", "OddFrequencyDataSource", "OddFrequencyBaseDataSource",
            "CompleteAbstractDataSource"]
@@ -1,25 +1,157 @@
 # encoding: utf-8
 import functools
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
-from lru import LRU
 from weakref import proxy
 
 import numpy as np
 from rqalpha.utils.datetime_func import convert_dt_to_int, convert_int_to_datetime
 from rqalpha.utils.logger import system_log
 
+from rqalpha_mod_fxdayu_source.data_source.common.minite import MiniteBarDataSourceMixin
+from rqalpha_mod_fxdayu_source.data_source.common.stats import CacheStats
+from rqalpha_mod_fxdayu_source.data_source.common.store import DiskBarsStore, SharedBarsStore, \
+    get_shared_memory_dir
+
+
+class BarsBuffer(object):
+    """
+    Sliding storage of bars, which keeps at most `window` latest rows.
+
+    New bars are written in place right after the current window. When the free space runs out, the window
+    is compacted into a freshly allocated buffer twice as large as the rows it holds, up to `capacity`,
+    so views returned before will never be overwritten.
+    """
+
+    def __init__(self, window, capacity=None):
+        self._window = window
+        self._capacity = max(capacity or self._default_capacity(window), window)
+        self._buffer = None
+        self._start = 0
+        self._end = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    @staticmethod
+    def _default_capacity(window):
+        # room to append half a window in place
+        return window + window // 2
+
+    @property
+    def window(self):
+        return self._window
+
+    @property
+    def data(self):
+        if self._buffer is None:
+            return None
+        return self._buffer[self._start:self._end]
+
+    @property
+    def nbytes(self):
+        """
+        Bytes of the whole allocated buffer, including the free space reserved for appending,
+        which is what the buffer really costs in memory.
+        """
+        return self._buffer.nbytes if self._buffer is not None else 0
+
+    def _allocate(self, length, dtype):
+        return np.empty((max(min(2 * length, self._capacity), length),), dtype=dtype)
+
+    def _compact(self, keep, length, dtype):
+        buffer = self._allocate(keep + length, dtype)
+        if keep:
+            buffer[:keep] = self._buffer[self._end - keep:self._end]
+        self._buffer = buffer
+        self._start = 0
+        self._end = keep
+
+    def append(self, bars):
+        """
+        Append bars after the window.
+
+        Returns
+        -------
+        int: Count of the oldest rows slid out of the window.
+        """
+        if bars is None or not len(bars):
+            return 0
+        before = len(self) + len(bars)
+        bars = bars[-self._window:]
+        length = len(bars)
+        if self._buffer is None or self._buffer.dtype.names != bars.dtype.names:
+            self._buffer = None
+            self._compact(0, length, bars.dtype)
+        elif self._end + length > len(self._buffer):
+            self._compact(min(len(self), self._window - length), length, self._buffer.dtype)
+        self._buffer[self._end:self._end + length] = bars
+        self._end += length
+        self._start = max(self._start, self._end - self._window)
+        return before - len(self)
+
+    def attach(self, bars):
+        """
+        Take bars, e.g. a read-only memory map shared with other processes, as the whole buffer
+        without copying. The buffer is full, so the next append compacts the window into a private one.
+        """
+        self._buffer = bars
+        self._start = 0
+        self._end = len(bars)
+        self._window = max(self._window, len(bars))
+        self._capacity = max(self._capacity, self._default_capacity(self._window))
+
+    def prepend(self, bars):
+        """
+        Prepend older bars, the window grows to hold them so that they would not slide out
+        with the next append.
+        """
+        if bars is None or not len(bars):
+            return
+        old = self.data
+        length = len(self) + len(bars)
+        self._window = max(self._window, len(self)) + len(bars)
+        self._capacity = max(self._capacity, self._default_capacity(self._window))
+        buffer = self._allocate(length, old.dtype if old is not None else bars.dtype)
+        buffer[:len(bars)] = bars
+        if old is not None:
+            buffer[len(bars):length] = old
+        self._buffer = buffer
+        self._start = 0
+        self._end = length
+
 
 class Cache(object):
-    def __init__(self, source, chunk, instrument, frequency):
+    def __init__(self, source, chunk, instrument, frequency, fields=None):
         self._source = proxy(source)
-        self._data = None
+        # 保留两倍缓存长度的空间到内存
+        self._bars = BarsBuffer(chunk * 2)
         self._finished = False
+        self._head_finished = False
+        # datetime from which no bar of the backend is missing before the first cached bar
+        self._covered_from = None
+        self._pending = None
         self._chunk = chunk
         self._instrument = instrument
         self._frequency = frequency
+        self._fields = tuple(fields) if fields is not None else None
 
     def __len__(self):
-        return len(self._data) if self._data is not None else 0
+        return len(self._bars)
+
+    @property
+    def _data(self):
+        return self._bars.data
+
+    @property
+    def first_dt(self):
+        if len(self):
+            return convert_int_to_datetime(self._data[0]["datetime"])
+        else:
+            return None
 
     @property
     def last_dt(self):
@@ -28,6 +160,14 @@ class Cache(object):
         else:
             return None
 
+    @property
+    def nbytes(self):
+        return self._bars.nbytes
+
+    @property
+    def window(self):
+        return self._bars.window
+
     @property
     def chunk(self):
         return self._chunk
@@ -40,11 +180,50 @@ class Cache(object):
     def frequency(self):
         return self._frequency
 
+    @property
+    def fields(self):
+        """
+        Fields cached besides datetime, None for all fields of the backend.
+        """
+        return self._fields
+
     @property
     def finished(self):
         return self._finished
 
-    def raw_history_bars(self, start_dt=None, end_dt=None, length=None, updated=False):
+    def covers(self, fields):
+        return self._fields is None or (fields is not None and set(fields).issubset(self._fields))
+
+    def _serve(self, bars, start, end):
+        threshold = self._source.prefetch_threshold
+        if threshold is not None and self._pending is None and not self._finished and \
+                len(bars) - end <= self._chunk * (1 - threshold):
+            # read the next chunk ahead in background
+            self._pending = (self._source.read_ahead(self), self.last_dt)
+        return bars[start:end]
+
+    def _merge_pending(self):
+        future, last_dt = self._pending
+        self._pending = None
+        try:
+            bars = future.result()
+        except Exception as e:
+            system_log.warning("缓存预读失败,品种:[{}]: {}".format(self.instrument.order_book_id, e))
+            return False
+        if last_dt != self.last_dt:  # the cache has moved on since then
+            return False
+        if bars is not None and len(bars):
+            self.update_bars(bars, self._chunk)
+            self._source._share_cache(self, last_dt + timedelta(seconds=1))
+        else:
+            self.close()
+        self._source.cache_stats.incr(self._frequency, "refills")
+        self._source._resize_cache(self)
+        return True
+
+    def raw_history_bars(self, start_dt=None, end_dt=None, length=None, updated=False, extended=False):
+        if self._pending is not None and self._pending[0].done():
+            self._merge_pending()
         bars = self._data
         if bars is not None:
             if end_dt:
@@ -56,64 +235,190 @@ class Cache(object):
             if start_dt:
                 start_dti = np.uint64(convert_dt_to_int(start_dt))
                 start_pos = bars["datetime"].searchsorted(start_dti, side="left")
+                # start datetime is early than cache
+                early = start_pos == 0 and bars[0]["datetime"] != start_dti and not self._head_finished and \
+                    (self._covered_from is None or start_dti < self._covered_from)
             if start_dt and end_dt:
                 if end_pos < len(bars) or bars[-1]["datetime"] == end_dti:
-                    if start_pos == 0 and bars[0]["datetime"] != start_dti:  # start datetime is early than cache
-                        return None
+                    if not early:
+                        return self._serve(bars, start_pos, end_pos)
+                    elif end_pos and not extended:
+                        # prefetch the older bars and serve the request from memory
+                        self._source.extend_cache(self, start_dt=start_dt)
+                        return self.raw_history_bars(start_dt, end_dt, length, updated, extended=True)
                     else:
-                        return bars[start_pos:end_pos]
+                        return None
                         # else update the cache
             elif length is not None:
                 if end_dt:
                     if end_pos < len(bars) or bars[-1]["datetime"] == end_dti:
-                        if end_pos - length < 0:
-                            return None
+                        if end_pos >= length or self._head_finished:
+                            return self._serve(bars, max(end_pos - length, 0), end_pos)
+                        elif end_pos and not extended:
+                            self._source.extend_cache(self, length=length - end_pos)
+                            return self.raw_history_bars(start_dt, end_dt, length, updated, extended=True)
                         else:
-                            return bars[end_pos - length: end_pos]
+                            return None
                             # else update the cache
                 elif start_dt:
-                    if start_pos == 0 and bars[0]["datetime"] != start_dti:
+                    if early:
                         return None
                     if start_pos + length <= len(bars):
-                        return bars[start_pos: start_pos + length]
+                        return self._serve(bars, start_pos, start_pos + length)
                         # else update the cache
         # update the cache
         if not self._finished and not updated:
-            self._source.update_cache(self, end_dt or start_dt)
-            return self.raw_history_bars(start_dt, end_dt, length, updated=True)
+            # wait for the chunk being read ahead rather than fetching it again
+            if self._pending is None or not self._merge_pending():
+                self._source.update_cache(self, end_dt or start_dt)
+            return self.raw_history_bars(start_dt, end_dt, length, updated=True, extended=extended)
         return None
 
     def update_bars(self, bars, count):
         system_log.debug("缓存更新,品种:[{}],时间:[{}, {}]".format(self.instrument.order_book_id,
                                                            bars["datetime"][0], bars["datetime"][-1]))
-        old = self._data
-        if old is not None and bars is not None:
-            self._data = np.concatenate((self._data, bars), axis=0)
-        else:
-            if old is not None:
-                self._data = old
-            elif bars is not None:
-                self._data = bars
-                # self._data should never be None
-        if self._data is not None and len(self._data) > self._chunk * 2:  # 保留两倍缓存长度的空间到内存
-            left = len(self._data) - self._chunk * 2
-            self._data = self._data[left:]
+        if self._bars.append(bars):
+            # the first bar of the backend is not cached any more
+            self._head_finished = False
+            self._covered_from = None
         self._finished = bars is None or len(bars) < count
         # import pandas as pd
         # system_log.debug(pd.DataFrame(self._data))
 
+    def attach_bars(self, bars):
+        """
+        Replace the cached bars by a window shared by other processes.
+        """
+        system_log.debug("缓存共享,品种:[{}],时间:[{}, {}]".format(self.instrument.order_book_id,
+                                                           bars["datetime"][0], bars["datetime"][-1]))
+        self._bars.attach(bars)
+        # flags of the sharing process are unknown, an extra request would correct them.
+        self._finished = False
+        self._head_finished = False
+        self._covered_from = None
+
+    def prepend_bars(self, bars, count=None, start_dt=None):
+        """
+        Prepend the bars right before the first cached bar.
+
+        Parameters
+        ----------
+        bars: numpy.ndarray
+            Older bars.
+        count: int
+            Count of bars requested, the head of the backend is reached if less bars are returned.
+        start_dt: datetime
+            Datetime the bars were requested from, which may fall between two bars, the cache covers
+            it after prepending so that requests starting from it would be served from memory.
+        """
+        self._bars.prepend(bars)
+        self._head_finished = bars is None or (count is not None and len(bars) < count)
+        if start_dt is not None:
+            self._covered_from = np.uint64(convert_dt_to_int(start_dt))
+        else:
+            self._covered_from = None
+
     def close(self):
         self._finished = True
 
 
+class CacheLRU(object):
+    """
+    LRU container of Cache objects or anything else with nbytes, bounded by the bytes actually
+    held by their bars instead of by the number of entries.
+    """
+
+    def __init__(self, max_space, on_evict=None):
+        self._max_space = max_space
+        self._on_evict = on_evict
+        self._items = OrderedDict()
+        self._sizes = {}
+        self._space = 0
+
+    @property
+    def space(self):
+        return self._space
+
+    @property
+    def max_space(self):
+        return self._max_space
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __getitem__(self, key):
+        cache = self._items[key]
+        self._items.move_to_end(key)
+        return cache
+
+    def __setitem__(self, key, cache):
+        if key in self._items:
+            del self[key]
+        self._items[key] = cache
+        self.resize(key)
+
+    def __delitem__(self, key):
+        del self._items[key]
+        self._space -= self._sizes.pop(key, 0)
+
+    def clear(self):
+        self._items.clear()
+        self._sizes.clear()
+        self._space = 0
+
+    def resize(self, key):
+        """
+        Recount the bytes held by the cache under given key, then evict least recently
+        used caches until the total space is under budget again.
+        """
+        nbytes = self._items[key].nbytes
+        self._space += nbytes - self._sizes.get(key, 0)
+        self._sizes[key] = nbytes
+        for oldest in list(self._items):
+            if self._space <= self._max_space:
+                break
+            if oldest == key:
+                # the cache just resized is in use, evict the others
+                continue
+            system_log.debug("缓存空间不足,释放品种:[{}],频率:[{}]".format(*oldest))
+            del self[oldest]
+            if self._on_evict is not None:
+                self._on_evict(oldest)
+
+
 class CacheMixin(object):
-    MAX_CACHE_SPACE = 40000000
+    MAX_CACHE_SPACE = 2 * 1024 ** 3  # bytes
     CACHE_LENGTH = 10000
+    CACHE_PATH = None
+    MAX_CACHE_PATH_SPACE = 10 * 1024 ** 3  # bytes
+    PREFETCH_THRESHOLD = None
+    SHARED_CACHE = False
+    # whether the backend can be read by the read ahead thread while the strategy thread reads it
+    THREAD_SAFE = False
 
     def __init__(self, *args, **kwargs):
         super(CacheMixin, self).__init__(*args, **kwargs)
         self._caches = None
+        self._executor = None
+        self._stats = CacheStats(type(self).__name__)
         self.clear_cache()
+        if self.PREFETCH_THRESHOLD is not None and not self.THREAD_SAFE:
+            system_log.warning("数据源[{}]不支持多线程读取, 缓存预读已关闭".format(type(self).__name__))
+        if self.CACHE_PATH:
+            self._disk_store = DiskBarsStore(os.path.join(self.CACHE_PATH, type(self).__name__),
+                                             self.MAX_CACHE_PATH_SPACE)
+        else:
+            self._disk_store = None
+        if self.SHARED_CACHE:
+            # files published to other processes are bounded by the same budget
+            self._shared_store = SharedBarsStore(os.path.join(
+                get_shared_memory_dir(), "rqalpha_mod_fxdayu_source", type(self).__name__
+            ), self.MAX_CACHE_SPACE)
+        else:
+            self._shared_store = None
         self._raw_history_bars = self.raw_history_bars
         self.raw_history_bars = self.decorator_raw_history_bars(self.raw_history_bars)
 
@@ -125,43 +430,315 @@ class CacheMixin(object):
     def set_max_cache_space(cls, value):
         cls.MAX_CACHE_SPACE = value
 
+    @classmethod
+    def set_cache_path(cls, value):
+        cls.CACHE_PATH = value
+
+    @classmethod
+    def set_max_cache_path_space(cls, value):
+        cls.MAX_CACHE_PATH_SPACE = value
+
+    @classmethod
+    def set_prefetch_threshold(cls, value):
+        cls.PREFETCH_THRESHOLD = value
+
+    @classmethod
+    def set_shared_cache(cls, value):
+        cls.SHARED_CACHE = value
+
     def clear_cache(self):
         if self._caches is None:
-            self._caches = LRU(self.MAX_CACHE_SPACE // self.CACHE_LENGTH)
+            self._caches = CacheLRU(self.MAX_CACHE_SPACE, on_evict=self._on_cache_evicted)
         else:
             self._caches.clear()
 
+    @property
+    def prefetch_threshold(self):
+        """
+        Threshold to read the next chunk ahead, None if disabled or the backend is not thread safe.
+        """
+        return self.PREFETCH_THRESHOLD if self.THREAD_SAFE else None
+
+    @property
+    def cache_space(self):
+        """
+        Bytes currently held by the bars cache.
+        """
+        return self._caches.space
+
+    @property
+    def cache_stats(self):
+        """
+        rqalpha_mod_fxdayu_source.data_source.common.stats.CacheStats: Statistics of the bars cache.
+        """
+        return self._stats
+
+    def _on_cache_evicted(self, key):
+        self._stats.incr(key[1], "evictions")
+        if self._shared_store is not None:
+            self._shared_store.remove(*key)
+
+    def release_shared_cache(self):
+        """
+        Delete the bars this process published to shared memory.
+        """
+        if self._shared_store is not None:
+            self._shared_store.release()
+
     def update_cache(self, cache, dt):
-        if len(cache):
-            last = cache.last_dt + timedelta(seconds=1)
-        else:
-            bar_data = self._raw_history_bars(cache.instrument, cache.frequency,
-                                              end_dt=dt - timedelta(seconds=1), length=cache.chunk)
-            if bar_data is not None and len(bar_data):
-                cache.update_bars(bar_data, len(bar_data))
-            last = dt
-        bar_data = self._raw_history_bars(cache.instrument, cache.frequency, start_dt=last, length=cache.chunk)
-        if bar_data is not None and len(bar_data):
-            cache.update_bars(bar_data, cache.chunk)
+        self._fill_caches([cache], dt)
+
+    def read_ahead(self, cache):
+        """
+        Fetch the next chunk of the cache in a background thread.
+
+        Returns
+        -------
+        concurrent.futures.Future: Future of the bars fetched.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        return self._executor.submit(self._fetch_bars, cache.instrument, cache.frequency,
+                                     start_dt=cache.last_dt + timedelta(seconds=1), length=cache.chunk,
+                                     fields=cache.fields)
+
+    def stop_read_ahead(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def warmup_cache(self, instruments, frequency, dt):
+        """
+        Fill the caches of all given instruments for the trading session of dt at once,
+        requests to the backend are issued concurrently where it supports.
+
+        Parameters
+        ----------
+        instruments: list of rqalpha.model.instrument.Instrument
+            Instruments to warm up.
+        frequency: str
+            Frequency of the strategy.
+        dt: datetime
+            Datetime before the first bar of the session.
+        """
+        session_end = dt.replace(hour=15, minute=0, second=0)
+        caches = []
+        for instrument in instruments:
+            try:
+                if self.is_base_frequency(instrument, frequency):
+                    frequency_ = frequency
+                elif frequency[-1] in ("m", "h") and self.is_base_frequency(instrument, "1m"):
+                    frequency_ = "1m"
+                elif frequency[-1] in ("d", "w") and self.is_base_frequency(instrument, "1d"):
+                    frequency_ = "1d"
+                else:
+                    continue
+            except KeyError:  # unsupported instrument type
+                continue
+            key = (instrument.order_book_id, frequency_)
+            # keep the fields the cache was narrowed to, rather than refetching all of them
+            cache = self._get_cache(instrument, frequency_, self._caches[key].fields if key in self._caches else None)
+            if not len(cache) or (not cache.finished and cache.last_dt < session_end):
+                caches.append(cache)
+        if caches:
+            system_log.debug("缓存预热: {}个品种, 频率[{}]".format(len(caches), frequency))
+            self._fill_caches(caches, dt)
+
+    def _fill_caches(self, caches, dt):
+        requests = []
+        filled = []
+        for cache in caches:
+            start_dt = cache.last_dt + timedelta(seconds=1) if len(cache) else dt
+            if self._attach_shared_cache(cache, start_dt):
+                continue
+            filled.append((cache, start_dt))
+            if len(cache):
+                requests.append((cache, dict(start_dt=cache.last_dt + timedelta(seconds=1), length=cache.chunk,
+                                             fields=cache.fields)))
+            else:
+                requests.append((cache, dict(end_dt=dt - timedelta(seconds=1), length=cache.chunk,
+                                             fields=cache.fields)))
+                requests.append((cache, dict(start_dt=dt, length=cache.chunk, fields=cache.fields)))
+        results = self._fetch_bars_batch([(cache.instrument, cache.frequency, kwargs) for cache, kwargs in requests])
+        for (cache, kwargs), bar_data in zip(requests, results):
+            if "end_dt" in kwargs:
+                if bar_data is not None and len(bar_data):
+                    cache.update_bars(bar_data, len(bar_data))
+            elif bar_data is not None and len(bar_data):
+                cache.update_bars(bar_data, cache.chunk)
+            else:
+                cache.close()
+        for cache, start_dt in filled:
+            self._share_cache(cache, start_dt)
+        for cache in caches:
+            self._stats.incr(cache.frequency, "refills")
+            self._resize_cache(cache)
+
+    def _attach_shared_cache(self, cache, start_dt):
+        """
+        Attach the window published by another process after it filled the same cache from start_dt,
+        if it holds all bars the cache would keep after filling by itself.
+        """
+        store = self._shared_store
+        if store is None:
+            return False
+        bars = store.load(cache.instrument.order_book_id, cache.frequency, start_dt=start_dt, length=cache.chunk,
+                          fields=cache.fields)
+        if bars is None or not len(bars):
+            return False
+        keep = cache.window - cache.chunk
+        if len(cache) and keep > 0 and bars[0]["datetime"] > cache._data[-min(keep, len(cache))]["datetime"]:
+            return False
+        cache.attach_bars(bars)
+        self._stats.incr(cache.frequency, "shared_hits")
+        return True
+
+    def _share_cache(self, cache, start_dt):
+        """
+        Publish the window of the cache just filled from start_dt to the other processes.
+        """
+        store = self._shared_store
+        # only a full chunk after start_dt means the window will never change
+        if store is None or cache.finished or not len(cache):
+            return
+        store.save(cache._data, cache.instrument.order_book_id, cache.frequency, start_dt=start_dt,
+                   length=cache.chunk, fields=cache.fields)
+
+    def extend_cache(self, cache, start_dt=None, length=None):
+        """
+        Extend the cache backwards with the bars right before its first cached bar.
+
+        Parameters
+        ----------
+        cache: Cache
+            Cache to extend.
+        start_dt: datetime
+            Extend back to this datetime.
+        length: int
+            Count of missing bars, one more chunk will be fetched to leave room for the
+            cache moving forward.
+        """
+        end_dt = cache.first_dt - timedelta(seconds=1)
+        if start_dt is not None:
+            bar_data = self._fetch_bars(cache.instrument, cache.frequency, start_dt=start_dt, end_dt=end_dt,
+                                        fields=cache.fields)
+            cache.prepend_bars(bar_data, start_dt=start_dt)
         else:
-            cache.close()
+            length += cache.chunk
+            bar_data = self._fetch_bars(cache.instrument, cache.frequency, end_dt=end_dt, length=length,
+                                        fields=cache.fields)
+            cache.prepend_bars(bar_data, length)
+        self._stats.incr(cache.frequency, "refills")
+        self._resize_cache(cache)
+
+    def _fetch_bars(self, instrument, frequency, start_dt=None, end_dt=None, length=None, fields=None):
+        kwargs = dict(start_dt=start_dt, end_dt=end_dt, length=length, fields=fields)
+        return self._fetch_bars_batch([(instrument, frequency, kwargs)])[0]
+
+    def _fetch_bars_batch(self, requests):
+        """
+        Fetch bars for the cache, reading from the disk store before the backend when it is enabled,
+        and writing the bars fetched from the backend back to it.
+
+        Parameters
+        ----------
+        requests: list of tuple
+            List of (instrument, frequency, kwargs of raw_history_bars).
+
+        Returns
+        -------
+        list: Bars of every request.
+        """
+        store = self._disk_store
+        results = [None] * len(requests)
+        missing = []
+        for n, (instrument, frequency, kwargs) in enumerate(requests):
+            if store is not None:
+                results[n] = store.load(instrument.order_book_id, frequency, **kwargs)
+            if results[n] is None:
+                missing.append(n)
+            else:
+                self._stats.incr(frequency, "disk_hits")
+        fetched = self._raw_history_bars_batch([requests[n] for n in missing])
+        for n, bars in zip(missing, fetched):
+            instrument, frequency, kwargs = requests[n]
+            if store is not None and self._is_history_fixed(frequency, bars, **kwargs):
+                store.save(bars, instrument.order_book_id, frequency, **kwargs)
+            results[n] = bars
+        for (instrument, frequency, kwargs), bars in zip(requests, results):
+            if bars is not None:
+                self._stats.incr(frequency, "bytes_loaded", bars.nbytes)
+        return results
+
+    def _raw_history_bars_batch(self, requests):
+        if isinstance(self, MiniteBarDataSourceMixin):
+            # minute bars are queried concurrently by the backend
+            return self._gather_raw_history_bars(requests, self._timed)
+        results = []
+        for instrument, frequency, kwargs in requests:
+            start = time.time()
+            results.append(self._raw_history_bars(instrument, frequency, **kwargs))
+            self._stats.add_fetch_latency(frequency, time.time() - start)
+        return results
+
+    async def _timed(self, frequency, coroutine):
+        start = time.time()
+        result = await coroutine
+        self._stats.add_fetch_latency(frequency, time.time() - start)
+        return result
+
+    def _is_history_fixed(self, frequency, bars, start_dt=None, end_dt=None, length=None, fields=None):
+        """
+        Whether the result of a request will never change, only those are persisted to disk.
+        """
+        if bars is None or not len(bars):
+            return False
+        if end_dt is not None:
+            return end_dt.date() < self.available_data_range(frequency)[1]
+        # bars after the requested range exist, if the request got as many bars as it asked for
+        return length is not None and len(bars) >= length
+
+    def _resize_cache(self, cache):
+        key = (cache.instrument.order_book_id, cache.frequency)
+        if key in self._caches:
+            self._caches.resize(key)
+
+    def _get_cache(self, instrument, frequency, fields=None):
+        """
+        Cache of (order_book_id, frequency) holding at least the given fields. A cache missing some
+        of them is replaced by a new one of all fields requested so far, and then filled again.
+        """
+        key = (instrument.order_book_id, frequency)
+        if key in self._caches:
+            cache = self._caches[key]
+            if cache.covers(fields):
+                return cache
+            if fields is not None:
+                fields = list(cache.fields) + [f for f in fields if f not in cache.fields]
+            system_log.debug("缓存字段扩展,品种:[{}],频率:[{}],字段:{}".format(
+                instrument.order_book_id, frequency, fields
+            ))
+        self._caches[key] = Cache(self, self.CACHE_LENGTH, instrument, frequency, fields)
+        return self._caches[key]
 
     def decorator_raw_history_bars(self, func):
         @functools.wraps(func)
-        def wrapped(instrument, frequency, start_dt=None, end_dt=None, length=None):
-            key = (instrument.order_book_id, frequency)
-            if key not in self._caches:
-                self._caches[key] = Cache(self, self.CACHE_LENGTH, instrument, frequency)
-            data = self._caches[key].raw_history_bars(start_dt, end_dt, length)
+        def wrapped(instrument, frequency, start_dt=None, end_dt=None, length=None, fields=None):
+            cache = self._get_cache(instrument, frequency, fields)
+            data = cache.raw_history_bars(start_dt, end_dt, length)
             if data is not None:
+                self._stats.incr(frequency, "hits")
+                if fields is not None and cache.fields != tuple(fields):
+                    data = data[["datetime"] + list(fields)]
                 return data
             else:
+                self._stats.incr(frequency, "misses")
                 system_log.debug("缓存未命中: 品种[{}]频率[{}] from {} to {}, length {}".format(
                     instrument.order_book_id, frequency, start_dt, end_dt, length
                 ))
-                return func(instrument, frequency, start_dt=start_dt, end_dt=end_dt, length=length)
+                return func(instrument, frequency, start_dt=start_dt, end_dt=end_dt, length=length, fields=fields)
 
         return wrapped
 
-    def raw_history_bars(self, instrument, frequency, start_dt=None, end_dt=None, length=None):
+    def raw_history_bars(self, instrument, frequency, start_dt=None, end_dt=None, length=None, fields=None):
         raise NotImplementedError
@@ -1,32 +1,61 @@
 import asyncio
+import os
+import threading
+import time
+from collections import namedtuple
 
 import numpy as np
 import pandas as pd
 from rqalpha.const import INSTRUMENT_TYPE
 from rqalpha.data.base_data_source import BaseDataSource
-from rqalpha.utils.datetime_func import convert_date_to_int, convert_int_to_date
+from rqalpha.utils.datetime_func import convert_dt_to_int
 from rqalpha.utils.logger import system_log
 
+from rqalpha_mod_fxdayu_source.share.trading_session import ASTOCK_TRADING_SESSION
+from rqalpha_mod_fxdayu_source.utils.asyncio import bounded_gather, get_asyncio_event_loop
+from rqalpha_mod_fxdayu_source.utils.resample import get_bar_count_table, get_frequency_minutes
 
-def parse_time_int(n):
-    hour, n = n // 10000, n % 10000
-    minuter, second = n // 100, n % 100
-    return hour, minuter, second
 
+DAY_END_TIME = 150000
+# tables of the rqalpha bundle read by BaseDataSource._all_day_bars_of
+DAY_BAR_TABLES = ["stocks.bcolz", "indexes.bcolz", "futures.bcolz", "funds.bcolz", "public_funds.bcolz"]
 
-def bar_count_in_section(start, end, base=60, offset=0):
-    hs, ms, ss = parse_time_int(start)
-    he, me, se = parse_time_int(end)
-    n_s = (hs * 3600 + ms * 60 + ss - 1 + offset) // base + 1
-    n_e = (he * 3600 + me * 60 + offset) // base
-    return max(n_e - n_s, 0)
+
+class DaysPlan(namedtuple("DaysPlan", ["start", "end", "days"])):
+    """
+    Plan of a minute bars request, bars from start to end in the trading days.
+
+    Attributes
+    ----------
+    start: int
+        Datetime of the first bar, in format "YYYYMMDDHHMMSS".
+    end: int
+        Datetime of the last bar, in format "YYYYMMDDHHMMSS".
+    days: numpy.ndarray
+        Trading days to query, in format "YYYYMMDD000000".
+    """
+    __slots__ = ()
+
+    def sections(self):
+        """
+        Time range of every day in the plan.
+
+        Returns
+        -------
+        list: List of (day, start_time, end_time), times in format "HHMMSS".
+        """
+        start_day, start_time = divmod(self.start, 1000000)
+        end_day, end_time = divmod(self.end, 1000000)
+        return [(day, start_time if day // 1000000 == start_day else 0,
+                 end_time if day // 1000000 == end_day else DAY_END_TIME) for day in self.days.tolist()]
 
 
 def safe_searchsorted(a, v, side='left', sorter=None):
     assert side in ["left", "right"]
     if not len(a):
         raise RuntimeError("Can't search in a empty array!")
-    pos = np.searchsorted(a, v, side=side, sorter=sorter)
+    # search with the dtype of the array, uint64 compared with int would be promoted to float64
+    pos = np.searchsorted(a, np.asarray(v, dtype=a.dtype), side=side, sorter=sorter)
     if pos >= len(a):
         system_log.warning(RuntimeWarning(
             "Value to search [%s] beyond array range [ %s - %s ], there may be some data missing."
@@ -37,20 +66,101 @@ def safe_searchsorted(a, v, side='left', sorter=None):
 
 
 class MiniteBarDataSourceMixin(BaseDataSource):
+    DATES_INDEX_CHECK_INTERVAL = 60  # seconds
+    MAX_CONCURRENT_REQUESTS = 16
+
+    def __init__(self, path, *args, **kwargs):
+        super(MiniteBarDataSourceMixin, self).__init__(path, *args, **kwargs)
+        self._bundle_path = path
+        self._dates_indexes = {}
+        self._bundle_mtime = self._get_bundle_mtime()
+        self._bundle_checked = time.time()
+        # day bars of the bundle may be read by the read ahead thread of the cache as well
+        self._bundle_lock = threading.RLock()
+
+    @classmethod
+    def set_max_concurrent_requests(cls, value):
+        cls.MAX_CONCURRENT_REQUESTS = value
+
+    def _get_bundle_mtime(self):
+        """
+        Latest modification time of the files of the day bar tables. bcolz rewrites the files inside
+        a table in place, which leaves the mtime of the bundle directory unchanged.
+        """
+        try:
+            mtimes = []
+            for name in DAY_BAR_TABLES:
+                for root, dirs, files in os.walk(os.path.join(self._bundle_path, name)):
+                    mtimes.append(os.stat(root).st_mtime)
+                    mtimes.extend(os.stat(os.path.join(root, f)).st_mtime for f in files)
+            return max(mtimes) if mtimes else None
+        except OSError:
+            return None
+
+    def _check_bundle(self):
+        """
+        Reopen the day bar tables and drop the cached dates indexes if the tables have changed,
+        checked at most once in an interval.
+        """
+        now = time.time()
+        if now - self._bundle_checked < self.DATES_INDEX_CHECK_INTERVAL:
+            return
+        self._bundle_checked = now
+        mtime = self._get_bundle_mtime()
+        if mtime != self._bundle_mtime:
+            system_log.debug("bundle 已更新, 重新打开日线数据并清空交易日索引缓存")
+            with self._bundle_lock:
+                self._bundle_mtime = mtime
+                # the opened tables keep the line map and the columns read before
+                self._day_bars = [type(store)(store._table.rootdir, store._converter) for store in self._day_bars]
+                self._dates_indexes.clear()
+                # day bars are memoized by rqalpha as well
+                for name in ("_all_day_bars_of", "_filtered_day_bars"):
+                    method = getattr(type(self), name, None)
+                    if hasattr(method, "cache_clear"):
+                        method.cache_clear()
+
     def _dates_index(self, instrument, skip_suspend=True):
-        if skip_suspend:
-            bars = self._filtered_day_bars(instrument)
-        else:
-            bars = self._all_day_bars_of(instrument)
-        dts = bars["datetime"]
+        """
+        Trading dates of the instrument in format "YYYYMMDD000000", as a contiguous array of int64
+        cached per instrument.
+        """
+        self._check_bundle()
+        key = (instrument.order_book_id, skip_suspend)
+        try:
+            return self._dates_indexes[key]
+        except KeyError:
+            pass
+        with self._bundle_lock:
+            if skip_suspend:
+                bars = self._filtered_day_bars(instrument)
+            else:
+                bars = self._all_day_bars_of(instrument)
+            dts = np.ascontiguousarray(bars["datetime"], dtype=np.int64)
+        self._dates_indexes[key] = dts
         return dts
 
-    def _get_bars_in_days(self, instrument, frequency, days):
+    async def _async_get_bars_in_days(self, instrument, frequency, plan, fields=None):
+        """
+        Coroutine to read the minute bars planned by a DaysPlan.
+        """
         raise NotImplementedError
 
+    def _get_bars_in_days(self, instrument, frequency, plan, fields=None):
+        loop = get_asyncio_event_loop()
+        return loop.run_until_complete(self._async_get_bars_in_days(instrument, frequency, plan, fields))
+
     def _post_handle_bars(self, bars):
         return bars
 
+    def _get_minute_trading_session(self, instrument):
+        """
+        Trading session which bars in a day are counted by, override it to support other instruments like futures.
+        """
+        if instrument.enum_type in [INSTRUMENT_TYPE.CS, INSTRUMENT_TYPE.INDX]:
+            return ASTOCK_TRADING_SESSION
+        raise RuntimeError("Only stock is supported!")
+
     def get_bar_count_in_day(self, instrument, frequency, trade_date=None, start_time=0, end_time=150000):
         """
         Get bar count of given instrument and frequency in a signle trading day,
@@ -65,91 +175,129 @@ class MiniteBarDataSourceMixin(BaseDataSource):
         trade_date: date
             Trade date to query.
         start_time: int
-            Int to represent start time, inf format "HHMMSS".
+            Int to represent start time, inf format "HHMMSS", bars at start time are not counted.
         end_time: int
             Int to represent end time, inf format "HHMMSS".
         Returns
         -------
         int: Return bar count in a single trading day.
         """
+        table = get_bar_count_table(self._get_minute_trading_session(instrument), get_frequency_minutes(frequency))
+        start = min(start_time // 10000 * 60 + start_time // 100 % 100, 1439)
+        end = min(end_time // 10000 * 60 + end_time // 100 % 100, 1439)
+        return max(int(table[end] - table[start]), 0)
 
-        if instrument.enum_type in [INSTRUMENT_TYPE.CS, INSTRUMENT_TYPE.INDX]:
-            unit = frequency[-1]
-            number = int(frequency[:-1])
-            if unit == "m":
-                offset = 0
-                factor = 60
-            elif unit == "h":
-                offset = 30 * 60  # 30min for A stock
-                factor = 60 * 60
-            start_time = max(93000, start_time)
-            end_time = min(150000, end_time)
-            if start_time > 113000:
-                return bar_count_in_section(start_time, end_time, number * factor, offset)
-            elif end_time <= 113000:
-                return bar_count_in_section(start_time, end_time, number * factor, offset)
+    def _get_days(self, instrument, frequency, start_dt=None, end_dt=None, length=None):
+        """
+        Plan the trading days to query for a minute bars request.
+
+        Returns
+        -------
+        tuple: DaysPlan of the bars to query and the function to cut the bars got by the plan.
+        """
+        dates = self._dates_index(instrument)
+        if start_dt and end_dt:
+            assert start_dt <= end_dt, "start datetime later then end datetime!"
+            start, end = convert_dt_to_int(start_dt), convert_dt_to_int(end_dt)
+            s_pos = safe_searchsorted(dates, start // 1000000 * 1000000)
+            e_pos = safe_searchsorted(dates, end // 1000000 * 1000000, side="right")
+            plan = DaysPlan(start, end, dates[s_pos:e_pos])
+            post_handler = lambda x: x
+        elif start_dt and length:
+            start = convert_dt_to_int(start_dt)
+            s_date_int = start // 1000000 * 1000000
+            s_pos = safe_searchsorted(dates, s_date_int, side="right")
+            if s_date_int > dates[-1] or (s_pos and dates[s_pos - 1] == s_date_int):
+                s_bar_count = self.get_bar_count_in_day(instrument, frequency, start_time=start % 1000000)
             else:
-                end_time = max(end_time, 130000)
-                return bar_count_in_section(start_time, 113000, number * factor, offset) + \
-                       bar_count_in_section(130000, end_time, number * factor, offset)
+                s_bar_count = 0  # not a trading day
+            total_bar_count = self.get_bar_count_in_day(instrument, frequency)
+            extra_days = (max(length - s_bar_count, 0) - 1) // total_bar_count + 1
+            days = np.insert(dates[s_pos: s_pos + extra_days], 0, s_date_int)
+            plan = DaysPlan(start, int(days[-1]) + DAY_END_TIME, days)
+            post_handler = lambda x: x[:length]
+        elif end_dt and length:
+            end = convert_dt_to_int(end_dt)
+            e_date_int = end // 1000000 * 1000000
+            e_pos = safe_searchsorted(dates, e_date_int)
+            if e_date_int > dates[-1] or dates[e_pos] == e_date_int:
+                e_bar_count = self.get_bar_count_in_day(instrument, frequency, end_time=end % 1000000)
+            else:
+                e_bar_count = 0  # not a trading day
+            total_bar_count = self.get_bar_count_in_day(instrument, frequency)
+            extra_days = (max(length - e_bar_count, 0) - 1) // total_bar_count + 1
+            days = np.append(dates[max(e_pos - extra_days, 0): e_pos], e_date_int)
+            plan = DaysPlan(int(days[0]), end, days)
+            post_handler = lambda x: x[-length:]
         else:
-            raise RuntimeError("Only stock is supported!")
+            raise RuntimeError("At least two of [start_dt,end_dt,length] should be given.")
+        return plan, post_handler
 
-    def raw_history_bars(self, instrument, frequency, start_dt=None, end_dt=None, length=None):
+    def raw_history_bars(self, instrument, frequency, start_dt=None, end_dt=None, length=None, fields=None):
         if frequency[-1] == "m":
-            days = []
-            if start_dt and end_dt:
-                assert start_dt <= end_dt, "start datetime later then end datetime!"
-                s_date, s_time = start_dt.date(), start_dt.time()
-                e_date, e_time = end_dt.date(), end_dt.time()
-                s_date_int = convert_date_to_int(s_date)
-                e_date_int = convert_date_to_int(e_date)
-                dates = self._dates_index(instrument)
-                s_pos = safe_searchsorted(dates, s_date_int)
-                e_pos = safe_searchsorted(dates, e_date_int, side="right") - 1
-                if s_pos == e_pos:
-                    days.append(dict(
-                        trade_date=convert_int_to_date(dates[s_pos]),
-                        start_time=s_time, end_time=e_time,
-                    ))
-                else:
-                    days.append(dict(trade_date=convert_int_to_date(dates[s_pos]), start_time=s_time))
-                    days.extend(map(
-                        lambda x: dict(trade_date=convert_int_to_date(x)),
-                        dates[s_pos + 1: e_pos]))
-                    days.append(dict(trade_date=convert_int_to_date(dates[e_pos]), end_time=e_time))
-                post_handler = lambda x: x
-            elif start_dt and length:
-                s_date, s_time = start_dt.date(), int(start_dt.strftime("%H%M%S"))
-                dates = self._dates_index(instrument)
-                s_date_int = convert_date_to_int(s_date)
-                s_pos = safe_searchsorted(dates, s_date_int)
-                s_bar_count = self.get_bar_count_in_day(instrument, frequency,
-                                                        trade_date=s_date, start_time=s_time)
-                total_bar_count = self.get_bar_count_in_day(instrument, frequency)
-                extra_days = (max(length - s_bar_count, 0) - 1) // total_bar_count + 1
-                days.append(dict(trade_date=s_date, start_time=s_time))
-                days.extend(map(
-                    lambda x: dict(trade_date=convert_int_to_date(x)),
-                    dates[s_pos + 1: s_pos + 1 + extra_days]))
-                post_handler = lambda x: x[:length]
-            elif end_dt and length:
-                e_date, e_time = end_dt.date(), int(end_dt.strftime("%H%M%S"))
-                dates = self._dates_index(instrument)
-                e_date_int = convert_date_to_int(e_date)
-                e_pos = safe_searchsorted(dates, e_date_int, side="right") - 1
-                e_bar_count = self.get_bar_count_in_day(instrument, frequency,
-                                                        trade_date=e_date, end_time=e_time)
-                total_bar_count = self.get_bar_count_in_day(instrument, frequency)
-                extra_days = (max(length - e_bar_count, 0) - 1) // total_bar_count + 1
-                days.extend(map(
-                    lambda x: dict(trade_date=convert_int_to_date(x)),
-                    dates[max(e_pos - extra_days, 0): e_pos]))
-                days.append(dict(trade_date=e_date, end_time=e_time))
-                post_handler = lambda x: x[-length:]
-            else:
-                raise RuntimeError("At least two of [start_dt,end_dt,length] should be given.")
-            data = post_handler(self._get_bars_in_days(instrument, frequency, days))
+            plan, post_handler = self._get_days(instrument, frequency, start_dt, end_dt, length)
+            data = post_handler(self._get_bars_in_days(instrument, frequency, plan, fields))
             return data
         else:
             return None
+
+    def _async_raw_history_bars(self, instrument, frequency, start_dt=None, end_dt=None, length=None, fields=None):
+        """
+        Coroutine version of raw_history_bars, only minute bars are supported,
+        return None for other frequencies.
+        """
+        if frequency[-1] != "m":
+            return None
+        return self._async_minute_bars(instrument, frequency, start_dt, end_dt, length, fields)
+
+    async def _async_minute_bars(self, instrument, frequency, start_dt=None, end_dt=None, length=None, fields=None):
+        plan, post_handler = self._get_days(instrument, frequency, start_dt, end_dt, length)
+        return post_handler(await self._async_get_bars_in_days(instrument, frequency, plan, fields))
+
+    def raw_history_bars_batch(self, requests):
+        """
+        Fetch bars of many requests from the backend at once, minute bars are queried concurrently
+        with at most MAX_CONCURRENT_REQUESTS queries in flight, caches are bypassed.
+
+        Parameters
+        ----------
+        requests: list of tuple
+            List of (instrument, frequency, kwargs of raw_history_bars), unique by (order_book_id, frequency).
+
+        Returns
+        -------
+        dict: (order_book_id, frequency) to bars.
+        """
+        results = self._gather_raw_history_bars(requests)
+        return {(instrument.order_book_id, frequency): bars
+                for (instrument, frequency, kwargs), bars in zip(requests, results)}
+
+    def _gather_raw_history_bars(self, requests, wrap=None):
+        """
+        Run the requests of raw_history_bars_batch concurrently.
+
+        Parameters
+        ----------
+        requests: list of tuple
+            List of (instrument, frequency, kwargs of raw_history_bars).
+        wrap: callable
+            Optional, called with the frequency and the coroutine of every request, returns the coroutine to run.
+
+        Returns
+        -------
+        list: Bars of every request.
+        """
+        coroutines = []
+        for instrument, frequency, kwargs in requests:
+            coroutine = self._async_raw_history_bars(instrument, frequency, **kwargs)
+            if coroutine is None:
+                # raw_history_bars of the class, not the one decorated by the cache
+                coroutine = self._async_sync_raw_history_bars(instrument, frequency, kwargs)
+            coroutines.append(coroutine if wrap is None else wrap(frequency, coroutine))
+        if not coroutines:
+            return []
+        loop = get_asyncio_event_loop()
+        return loop.run_until_complete(bounded_gather(coroutines, self.MAX_CONCURRENT_REQUESTS))
+
+    async def _async_sync_raw_history_bars(self, instrument, frequency, kwargs):
+        return type(self).raw_history_bars(self, instrument, frequency, **kwargs)
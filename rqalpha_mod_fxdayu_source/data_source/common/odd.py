@@ -1,60 +1,266 @@
 # encoding: utf-8
+from collections import OrderedDict
 
-import pandas as pd
-from rqalpha.data.adjust import FIELDS_REQUIRE_ADJUSTMENT, adjust_bars
+import numpy as np
+from rqalpha.data.adjust import FIELDS_REQUIRE_ADJUSTMENT, PRICE_FIELDS, adjust_bars
 from rqalpha.data.base_data_source import BaseDataSource
 from rqalpha.interface import AbstractDataSource
-from rqalpha.utils.datetime_func import convert_dt_to_int
+from rqalpha.utils.datetime_func import convert_dt_to_int, convert_date_to_int
 
-from rqalpha_mod_fxdayu_source.utils.converter import DataFrameConverter
+from rqalpha_mod_fxdayu_source.data_source.common.cache import BarsBuffer, CacheLRU, CacheMixin
+from rqalpha_mod_fxdayu_source.data_source.common.minite import MiniteBarDataSourceMixin
+from rqalpha_mod_fxdayu_source.share.trading_session import ASTOCK_TRADING_SESSION
+from rqalpha_mod_fxdayu_source.utils.resample import fill_suspended_bars, get_day_labels, get_frequency_minutes, \
+    get_resample_labels, get_session_grid, get_week_labels, resample_bars, resample_bars_by_labels
 
-RESAMPLE_TAG_MAP = {
-    "m": "T",
-    "h": "h",
-    "d": "d",
-}
+PANEL_FIELDS = ["open", "high", "low", "close", "volume"]
 
 TIME_TOLERANCE = {
     "m": 100,
     "h": 10000,
     "d": 1000000,
+    "w": 7000000,
 }
 
 
+class Memo(object):
+    """
+    Bars memoized by OddFrequencyDataSource and the tag they are valid under, sized for CacheLRU.
+    """
+    __slots__ = ("tag", "bars")
+
+    def __init__(self, tag, bars):
+        self.tag = tag
+        self.bars = bars
+
+    @property
+    def nbytes(self):
+        return self.bars.nbytes
+
+
 class OddFrequencyDataSource(AbstractDataSource):
+    RESAMPLE_CACHE = True
+    ADJUST_CACHE = True
+    MAX_MEMO_SPACE = 512 * 1024 ** 2  # bytes
+
     def __init__(self, *args, **kwargs):
         super(OddFrequencyDataSource, self).__init__(*args, **kwargs)
+        # resampled and adjusted bars keyed by (order_book_id, frequency, kind)
+        self._memos = CacheLRU(self.MAX_MEMO_SPACE)
+        self._resample_bar_states = {}
+        self._trading_dates = None
+
+    @classmethod
+    def set_resample_cache(cls, value):
+        cls.RESAMPLE_CACHE = value
+
+    @classmethod
+    def set_adjust_cache(cls, value):
+        cls.ADJUST_CACHE = value
+
+    @classmethod
+    def set_max_memo_space(cls, value):
+        cls.MAX_MEMO_SPACE = value
+
+    @staticmethod
+    def _resample_bars(bars, frequency, session=None):
+        return resample_bars(bars, frequency, session)
+
+    def _get_trading_session(self, instrument):
+        """
+        Trading session which buckets of the odd frequencies are aligned with, None to resample by the clock.
+        """
+        if instrument.type == "Future":
+            # TODO sessions of futures vary with products
+            return None
+        return ASTOCK_TRADING_SESSION
+
+    def _history_resampled_bars(self, instrument, frequency, dt, bar_count):
+        """
+        Resample the minute bars before dt into the odd minute or hour frequency, at least bar_count + 1
+        buckets are returned and the last one may be still in progress.
+
+        Completed buckets are cached by (order_book_id, frequency) within MAX_MEMO_SPACE, so only the
+        minute bars after them are resampled for the following calls.
+
+        Returns
+        -------
+        numpy.ndarray: Resampled bars, or None if the minute bars are not available.
+        """
+        num = get_frequency_minutes(frequency)
+        key = (instrument.order_book_id, frequency, "resample")
+        session = self._get_trading_session(instrument)
+        current = get_resample_labels(np.array([convert_dt_to_int(dt)]), num, session)[0]
+        memo = self._memos[key] if self.RESAMPLE_CACHE and key in self._memos else None
+        done = memo.bars if memo is not None else None
+        # the buffer must be able to hold bar_count + 1 buckets, and holds all buckets since the first minute
+        # bar only if none has slid out
+        if done is not None and len(done) and bar_count + 1 <= done.window and \
+                (len(done) >= bar_count + 1 or memo.tag) and \
+                get_resample_labels(done.data["datetime"][-1:], num, session)[0] < current:
+            last = done.data["datetime"][-1]
+            length = 2 * num
+            while True:
+                bars = self.raw_history_bars(instrument, "1m", end_dt=dt, length=length)
+                if bars is None or len(bars) < length or bars[0]["datetime"] <= last:
+                    break
+                length *= 4
+                if length > (bar_count + 1) * num:
+                    # too far away from the cached buckets
+                    bars = None
+                    break
+            if bars is not None:
+                bars = bars[bars["datetime"] > last]
+                if not bars.size:
+                    return done.data[-bar_count - 1:]
+                bars = self._resample_bars(bars, frequency, session)
+                completed = get_resample_labels(bars["datetime"], num, session) < current
+                if done.append(bars[completed]):
+                    # the first buckets are not held any more
+                    memo.tag = False
+                self._memos.resize(key)
+                return np.concatenate([done.data[-bar_count - 1:], bars[~completed]])
+        # one more bucket in case the first one is cut off
+        length = (bar_count + 2) * num
+        minutes = self.raw_history_bars(instrument, "1m", end_dt=dt, length=length)
+        if minutes is None or not minutes.size:
+            return minutes
+        bars = self._resample_bars(minutes, frequency, session)
+        if self.RESAMPLE_CACHE:
+            completed = bars[get_resample_labels(bars["datetime"], num, session) < current]
+            head_finished = len(minutes) < length
+            if not head_finished:
+                completed = completed[1:]
+            done = BarsBuffer(2 * (bar_count + 1))
+            done.append(completed)
+            self._memos[key] = Memo(head_finished, done)
+        return bars
+
+    def _get_resampled_bar(self, instrument, frequency, dt):
+        """
+        Resample the bar of the odd minute or hour frequency in progress at dt. The bar is kept per
+        (order_book_id, frequency) and updated with the new 1m bar while dt steps forward bar by bar.
+
+        Returns
+        -------
+        numpy.ndarray: Resampled bars which the last one is in progress at dt, or None if the minute bars
+        are not available.
+        """
+        num = get_frequency_minutes(frequency)
+        key = (instrument.order_book_id, frequency)
+        session = self._get_trading_session(instrument)
+        state = self._resample_bar_states.get(key) if self.RESAMPLE_CACHE else None
+        if state is not None:
+            label, bar = state
+            minutes = self.raw_history_bars(instrument, "1m", end_dt=dt, length=2)
+            if minutes is not None and len(minutes):
+                last = bar["datetime"][0]
+                if minutes["datetime"][-1] == last:
+                    return bar
+                if len(minutes) == 2 and minutes["datetime"][0] == last:
+                    minute = minutes[-1:]
+                    if get_resample_labels(minute["datetime"], num, session)[0] == label:
+                        # bars returned before are never modified
+                        bar = bar.copy()
+                        bar["datetime"] = minute["datetime"]
+                        bar["high"] = np.fmax(bar["high"], minute["high"])
+                        bar["low"] = np.fmin(bar["low"], minute["low"])
+                        bar["close"] = minute["close"]
+                        bar["volume"] += minute["volume"]
+                    else:
+                        bar = self._resample_bars(minute, frequency, session)
+                        label = get_resample_labels(bar["datetime"], num, session)[0]
+                    self._resample_bar_states[key] = (label, bar)
+                    return bar
+        bars = self.raw_history_bars(instrument, "1m", end_dt=dt, length=num)
+        if bars is None or not bars.size:
+            return bars
+        bars = self._resample_bars(bars, frequency, session)
+        if self.RESAMPLE_CACHE:
+            self._resample_bar_states[key] = (get_resample_labels(bars["datetime"][-1:], num, session)[0], bars[-1:])
+        return bars
+
+    def _fill_suspended_bars(self, instrument, frequency, bars, dt):
+        """
+        Fill the buckets of the odd minute or hour frequency in which the instrument was suspended, from the
+        first bar on until the bucket of dt.
+        """
+        session = self._get_trading_session(instrument)
+        if session is None or bars is None or not len(bars):
+            # TODO buckets of futures
+            return bars
+        num = get_frequency_minutes(frequency)
+        dti = convert_dt_to_int(dt)
+        dates = self._get_trading_dates()
+        dates = dates[dates.searchsorted(bars["datetime"][0] // 1000000):dates.searchsorted(dti // 1000000, "right")]
+        grid_labels, grid_datetimes = get_session_grid(dates, session, num)
+        current = get_resample_labels(np.array([dti]), num, session)[0]
+        if dti % 1000000 < session.start.hour * 10000 + session.start.minute * 100:
+            # the first bucket of the day is not started yet
+            end = grid_labels.searchsorted(current)
+        else:
+            end = grid_labels.searchsorted(current, side="right")
+        grid_labels, grid_datetimes = grid_labels[:end], grid_datetimes[:end]
+        if end and grid_labels[-1] == current:
+            # bar in progress
+            grid_datetimes[-1] = min(grid_datetimes[-1], dti)
+        return fill_suspended_bars(bars, get_resample_labels(bars["datetime"], num, session),
+                                   grid_labels, grid_datetimes)
+
+    def _get_trading_dates(self):
+        if self._trading_dates is None:
+            calendar = self.get_trading_calendar()
+            self._trading_dates = np.asarray(calendar.year * 10000 + calendar.month * 100 + calendar.day,
+                                             dtype=np.int64)
+        return self._trading_dates
+
+    def _get_day_bars(self, instrument, dt, length):
+        if self.is_base_frequency(instrument, "1d"):
+            return self.raw_history_bars(instrument, "1d", end_dt=dt, length=length)
+        return super(OddFrequencyDataSource, self).history_bars(instrument, length, "1d", None, dt,
+                                                                 adjust_type="none")
 
     @staticmethod
-    def _resample_bars(bars, frequency):
+    def _is_resampled_day_frequency(frequency):
+        """
+        Whether the frequency is resampled from the daily bars, 1d itself is read as it is.
+        """
+        return frequency[-1] == "w" or (frequency[-1] == "d" and int(frequency[:-1]) > 1)
+
+    def _history_resampled_day_bars(self, instrument, frequency, dt, bar_count):
+        """
+        Resample the daily bars before dt into the odd day or week frequency, buckets of days are
+        counted by the positions in the trading calendar and buckets of weeks start on monday.
+        At least bar_count + 1 buckets are returned and the last one may be still in progress.
+
+        Returns
+        -------
+        numpy.ndarray: Resampled bars, or None if the daily bars are not available.
+        """
         num = int(frequency[:-1])
-        freq = frequency[-1]
-        bar_data = DataFrameConverter.np2df(bars)
-        bar_data = bar_data.set_index(bar_data["datetime"].values)
-        resample_freq = str(num) + RESAMPLE_TAG_MAP[freq]
-        resample_group = bar_data.resample(resample_freq, closed="right", label="right")
-        resample_data = pd.DataFrame()
-        resample_data["high"] = resample_group["high"].max().dropna()
-        resample_data["low"] = resample_group["low"].min().dropna()
-        resample_data["close"] = resample_group["close"].last().dropna()
-        resample_data["open"] = resample_group["open"].first().dropna()
-        resample_data["volume"] = resample_group["volume"].sum().dropna()
-        resample_data["datetime"] = resample_group["datetime"].last().dropna()
-        bar_data = resample_data.reset_index(list(range(len(resample_data))), drop=True)
-        bar_data = DataFrameConverter.df2np(bar_data)
-        return bar_data
+        length = (bar_count + 2) * num * (5 if frequency[-1] == "w" else 1)
+        days = self._get_day_bars(instrument, dt, length)
+        if days is None or not len(days):
+            return days
+        if frequency[-1] == "w":
+            labels = get_week_labels(days["datetime"], num)
+        else:
+            labels = get_day_labels(days["datetime"], num, self._get_trading_dates())
+        bars = resample_bars_by_labels(days, labels)
+        # the first bucket may be cut off
+        return bars[1:] if len(days) >= length else bars
 
     def get_bar(self, instrument, dt, frequency):
         num = int(frequency[:-1])
         freq = frequency[-1]
         if self.is_base_frequency(instrument, frequency):
             bars = self.raw_history_bars(instrument, frequency, end_dt=dt, length=1)
+        elif freq in ("m", "h"):
+            bars = self._get_resampled_bar(instrument, frequency, dt)
+        elif self._is_resampled_day_frequency(frequency):
+            bars = self._history_resampled_day_bars(instrument, frequency, dt, 1)
         else:
-            if freq == "m":
-                bars = self.raw_history_bars(instrument, "1" + freq, end_dt=dt, length=num)
-                bars = self._resample_bars(bars, frequency)
-            else:
-                return super(OddFrequencyDataSource, self).get_bar(instrument, dt, frequency)
+            return super(OddFrequencyDataSource, self).get_bar(instrument, dt, frequency)
         if bars is None or not bars.size:
             return super(OddFrequencyDataSource, self).get_bar(
                 instrument, dt, frequency
@@ -77,13 +283,16 @@ class OddFrequencyDataSource(AbstractDataSource):
                      skip_suspended=True, include_now=False,
                      adjust_type='pre', adjust_orig=None):
         if self.is_base_frequency(instrument, frequency):
-            bars = self.raw_history_bars(instrument, frequency, end_dt=dt, length=bar_count)
+            # only the fields requested are read from the backend
+            bars = self.raw_history_bars(instrument, frequency, end_dt=dt, length=bar_count,
+                                         fields=self._get_raw_fields(fields))
         else:
-            num = int(frequency[:-1])
             freq = frequency[-1]
-            if freq == "m":
-                lower_bar_count = (bar_count + 1) * num
-                bars = self.raw_history_bars(instrument, "1" + freq, end_dt=dt, length=lower_bar_count)
+            if freq in ("m", "h") or self._is_resampled_day_frequency(frequency):
+                if freq in ("m", "h"):
+                    bars = self._history_resampled_bars(instrument, frequency, dt, bar_count)
+                else:
+                    bars = self._history_resampled_day_bars(instrument, frequency, dt, bar_count)
                 if bars is None:
                     return super(OddFrequencyDataSource, self).history_bars(
                         instrument, bar_count, frequency, fields, dt,
@@ -91,15 +300,18 @@ class OddFrequencyDataSource(AbstractDataSource):
                         adjust_type=adjust_type, adjust_orig=adjust_orig
                     )
                 else:
-                    if bars.size:
-                        bars = self._resample_bars(bars, frequency)
+                    if not skip_suspended and freq in ("m", "h"):
+                        bars = self._fill_suspended_bars(instrument, frequency, bars, dt)
+                    if bars.size and freq in ("d", "w"):
+                        # the same as the daily bars, the bucket of the day of dt is always included
+                        bars = bars[-bar_count:]
+                    elif bars.size:
                         dti = convert_dt_to_int(dt)
                         if bars["datetime"][-1] != dti and not include_now:
                             bars = bars[:-1]
                             bars = bars[-bar_count:]
                         else:
                             bars = bars[-bar_count:]
-                            # TODO 跳过停牌
             else:
                 return super(OddFrequencyDataSource, self).history_bars(
                     instrument, bar_count, frequency, fields, dt,
@@ -109,12 +321,151 @@ class OddFrequencyDataSource(AbstractDataSource):
                 # if fields is not None:
                 #     if not isinstance(fields, six.string_types):
                 #         fields = [field for field in fields if field in bar_data]
+        return self._adjust_history_bars(instrument, frequency, bars, fields, adjust_type, adjust_orig)
+
+    def _adjust_history_bars(self, instrument, frequency, bars, fields, adjust_type, adjust_orig):
         if adjust_type == "none" or instrument.type in {"Future", "INDX"}:
             return bars if fields is None else bars[fields]
         if isinstance(fields, str) and fields not in FIELDS_REQUIRE_ADJUSTMENT:
             return bars if fields is None else bars[fields]
-        return adjust_bars(bars, self.get_ex_cum_factor(instrument.order_book_id),
-                           fields, adjust_type, adjust_orig)
+        return self._adjust_bars(instrument, frequency, bars, fields, adjust_type, adjust_orig)
+
+    def history_bars_panel(self, instruments, bar_count, frequency, fields, dt,
+                           skip_suspended=True, include_now=False,
+                           adjust_type='pre', adjust_orig=None):
+        """
+        History bars of many instruments aligned by datetime. The caches of all instruments are warmed up
+        at once if the data source caches them, otherwise bars of the base frequency are queried concurrently
+        if the data source supports.
+
+        Parameters
+        ----------
+        instruments: list of rqalpha.model.instrument.Instrument
+            Instruments to read.
+        fields: str or list of str
+            Fields to read, open, high, low, close and volume if None.
+
+        Other parameters are the same as history_bars.
+
+        Returns
+        -------
+        collections.OrderedDict: "datetime" to the latest bar_count datetimes of all bars, and every field
+        to an array of shape (bar_count, len(instruments)), missing bars are filled with nan.
+        """
+        fetched = {}
+        if isinstance(self, CacheMixin):
+            self.warmup_cache(instruments, frequency, dt)
+        elif isinstance(self, MiniteBarDataSourceMixin):
+            # the same requests as history_bars of the base frequency
+            requests = [(instrument, frequency, dict(end_dt=dt, length=bar_count))
+                        for instrument in instruments if self.is_base_frequency(instrument, frequency)]
+            if requests:
+                fetched = self.raw_history_bars_batch(requests)
+        bars = []
+        for instrument in instruments:
+            key = (instrument.order_book_id, frequency)
+            if key in fetched:
+                bars.append(self._adjust_history_bars(instrument, frequency, fetched[key], None,
+                                                      adjust_type, adjust_orig))
+            else:
+                bars.append(self.history_bars(instrument, bar_count, frequency, None, dt,
+                                              skip_suspended=skip_suspended, include_now=include_now,
+                                              adjust_type=adjust_type, adjust_orig=adjust_orig))
+        datetimes = [b["datetime"] for b in bars if b is not None and len(b)]
+        datetimes = np.unique(np.concatenate(datetimes))[-bar_count:] if datetimes else np.empty((0,), np.uint64)
+        fields = self._get_panel_fields(fields)
+        result = OrderedDict([("datetime", datetimes)])
+        for field in fields:
+            result[field] = np.full((len(datetimes), len(instruments)), np.nan)
+        for n, b in enumerate(bars):
+            if b is None or not len(b) or not len(datetimes):
+                continue
+            b = b[b["datetime"] >= datetimes[0]]
+            pos = datetimes.searchsorted(b["datetime"])
+            for field in fields:
+                result[field][pos, n] = b[field]
+        return result
+
+    @staticmethod
+    def _get_raw_fields(fields):
+        """
+        Fields besides datetime to pass down to raw_history_bars, None for all fields.
+        """
+        if fields is None:
+            return None
+        elif isinstance(fields, str):
+            fields = [fields]
+        return [field for field in fields if field != "datetime"]
+
+    @staticmethod
+    def _get_panel_fields(fields):
+        if fields is None:
+            return PANEL_FIELDS
+        elif isinstance(fields, str):
+            return [fields]
+        return [field for field in fields if field != "datetime"]
+
+    def _adjust_panel(self, instruments, panel, adjust_type, adjust_orig):
+        """
+        Adjust the fields of a panel returned by history_bars_panel inplace.
+        """
+        if adjust_type == "none":
+            return panel
+        for n, instrument in enumerate(instruments):
+            ex_factors = self.get_ex_cum_factor(instrument.order_book_id)
+            if ex_factors is None or instrument.type in {"Future", "INDX"}:
+                continue
+            base = self._get_base_adjust_rate(ex_factors, adjust_type, adjust_orig)
+            factors = ex_factors["ex_cum_factor"].take(
+                ex_factors["start_date"].searchsorted(panel["datetime"], side="right") - 1
+            ) / base
+            for field, values in panel.items():
+                if field in PRICE_FIELDS:
+                    values[:, n] *= factors
+                elif field == "volume":
+                    values[:, n] /= factors
+        return panel
+
+    @staticmethod
+    def _get_base_adjust_rate(ex_factors, adjust_type, adjust_orig):
+        if adjust_type == "pre":
+            pos = ex_factors["start_date"].searchsorted(np.uint64(convert_date_to_int(adjust_orig)), side="right")
+            return ex_factors["ex_cum_factor"][pos - 1]
+        return 1.0
+
+    def _adjust_bars(self, instrument, frequency, bars, fields, adjust_type, adjust_orig):
+        """
+        Adjust bars with the ex cum factors, the adjusted bars are kept per (order_book_id, frequency)
+        within MAX_MEMO_SPACE and reused while the ex cum factors, the base adjust rate and the fields
+        read stay the same, only bars after them are adjusted again.
+        """
+        ex_factors = self.get_ex_cum_factor(instrument.order_book_id)
+        if not self.ADJUST_CACHE or ex_factors is None or bars is None or not len(bars):
+            return adjust_bars(bars, ex_factors, fields, adjust_type, adjust_orig)
+        epoch = (adjust_type, self._get_base_adjust_rate(ex_factors, adjust_type, adjust_orig), bars.dtype.names,
+                 ex_factors.tobytes())
+        key = (instrument.order_book_id, frequency, "adjust")
+        memo = self._memos[key] if key in self._memos else None
+        if memo is not None and memo.tag == epoch and memo.bars.window >= len(bars):
+            buffer = memo.bars
+            data = buffer.data
+            start = data["datetime"].searchsorted(bars["datetime"][0])
+            count = min(len(data) - start, len(bars))
+            # datetimes are unique and sorted, so matched ends mean the same bars
+            if count and data["datetime"][start] == bars["datetime"][0] and \
+                    data["datetime"][start + count - 1] == bars["datetime"][count - 1]:
+                if count < len(bars):
+                    buffer.append(adjust_bars(bars[count:], ex_factors, None, adjust_type, adjust_orig))
+                    self._memos.resize(key)
+                    data = buffer.data[-len(bars):]
+                else:
+                    data = data[start:start + count]
+                return data if fields is None else data[fields]
+        adjusted = adjust_bars(bars, ex_factors, None, adjust_type, adjust_orig)
+        buffer = BarsBuffer(2 * len(bars))
+        buffer.append(adjusted)
+        self._memos[key] = Memo(epoch, buffer)
+        return adjusted if fields is None else adjusted[fields]
 
     def get_ex_cum_factor(self, order_book_id):
         raise NotImplementedError
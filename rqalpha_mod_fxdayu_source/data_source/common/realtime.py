@@ -10,6 +10,17 @@ from rqalpha_mod_fxdayu_source.data_source.common.odd import CompleteAbstractDat
 EMPTY_BARS = None
 
 
+def _select_fields(bars, fields):
+    """
+    Copy the fields of bars into packed bars, a view of some fields of a structured array keeps
+    the itemsize of all of them and can not be concatenated with others.
+    """
+    result = np.empty(bars.shape, dtype=[(field, bars.dtype[field]) for field in fields])
+    for field in fields:
+        result[field] = bars[field]
+    return result
+
+
 class RealtimeDataSource(OddFrequencyDataSource, CompleteAbstractDataSource):
     def is_suspended(self, order_book_id, dates):
         return self._hist_source.is_suspended(order_book_id, dates)
@@ -65,7 +76,7 @@ class RealtimeDataSource(OddFrequencyDataSource, CompleteAbstractDataSource):
         self._inday_bars = inday_bars
         self._hist_source = hist_source
 
-    def raw_history_bars(self, instrument, frequency, start_dt=None, end_dt=None, length=None):
+    def raw_history_bars(self, instrument, frequency, start_dt=None, end_dt=None, length=None, fields=None):
         env = Environment.get_instance()
         now = env.calendar_dt
         today = now.date()
@@ -87,14 +98,15 @@ class RealtimeDataSource(OddFrequencyDataSource, CompleteAbstractDataSource):
                 history_bars = self._hist_source.raw_history_bars(
                     instrument, frequency,
                     start_dt=start_dt,
-                    end_dt=min(end_dt, yesterday)
+                    end_dt=min(end_dt, yesterday),
+                    fields=fields
                 )
         elif start_dt and length:
             if start_dt.date() > today:
                 return EMPTY_BARS
             if start_dt.date() < today:
                 history_bars = self._hist_source.raw_history_bars(
-                    instrument, frequency, start_dt=start_dt, length=length)
+                    instrument, frequency, start_dt=start_dt, length=length, fields=fields)
             left = length - len(history_bars) if history_bars is not None else length
             start_time = convert_dt_to_int(start_dt) % 1000000 if start_dt.date() == today else None
             today_bars = self._inday_bars.get_bars(instrument, frequency,
@@ -108,9 +120,16 @@ class RealtimeDataSource(OddFrequencyDataSource, CompleteAbstractDataSource):
             left = length - len(today_bars) if today_bars is not None else length
             if left > 0:
                 history_bars = self._hist_source.raw_history_bars(
-                    instrument, frequency, end_dt=min(end_dt, yesterday), length=left)
+                    instrument, frequency, end_dt=min(end_dt, yesterday), length=left, fields=fields)
         else:
             raise RuntimeError
+        if fields is not None:
+            # bars served by caches may be views of more fields
+            fields_ = ["datetime"] + list(fields)
+            if today_bars is not None:
+                today_bars = _select_fields(today_bars, fields_)
+            if history_bars is not None:
+                history_bars = _select_fields(history_bars, fields_)
         if history_bars is not None and today_bars is not None:
             return np.concatenate([history_bars, today_bars])
         elif history_bars is not None:
@@ -0,0 +1,79 @@
+# encoding: utf-8
+import json
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+
+class LatencyHistogram(object):
+    BOUNDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)  # seconds
+
+    def __init__(self):
+        self._counts = [0] * (len(self.BOUNDS) + 1)
+        self._count = 0
+        self._total = 0.0
+        self._max = 0.0
+
+    def add(self, seconds):
+        self._counts[bisect_left(self.BOUNDS, seconds)] += 1
+        self._count += 1
+        self._total += seconds
+        self._max = max(self._max, seconds)
+
+    def to_dict(self):
+        buckets = OrderedDict(("<=%ss" % bound, count) for bound, count in zip(self.BOUNDS, self._counts))
+        buckets[">%ss" % self.BOUNDS[-1]] = self._counts[-1]
+        return OrderedDict([
+            ("count", self._count),
+            ("total", self._total),
+            ("mean", self._total / self._count if self._count else 0.0),
+            ("max", self._max),
+            ("buckets", buckets),
+        ])
+
+
+class CacheStats(object):
+    """
+    Counters and backend fetch latency of the bars cache, grouped by frequency.
+    """
+    COUNTERS = ("hits", "misses", "refills", "disk_hits", "shared_hits", "bytes_loaded", "evictions")
+
+    def __init__(self, backend):
+        self._backend = backend
+        self._counters = {}
+        self._latency = {}
+        self._lock = threading.Lock()  # the cache may fetch bars in background thread
+
+    @property
+    def backend(self):
+        return self._backend
+
+    def incr(self, frequency, counter, value=1):
+        with self._lock:
+            if frequency not in self._counters:
+                self._counters[frequency] = OrderedDict.fromkeys(self.COUNTERS, 0)
+            self._counters[frequency][counter] += value
+
+    def add_fetch_latency(self, frequency, seconds):
+        with self._lock:
+            if frequency not in self._latency:
+                self._latency[frequency] = LatencyHistogram()
+            self._latency[frequency].add(seconds)
+
+    def get(self, frequency, counter):
+        return self._counters.get(frequency, {}).get(counter, 0)
+
+    def report(self):
+        with self._lock:
+            frequencies = OrderedDict()
+            for frequency in sorted(set(self._counters) | set(self._latency)):
+                item = OrderedDict(self._counters.get(frequency, OrderedDict.fromkeys(self.COUNTERS, 0)))
+                total = item["hits"] + item["misses"]
+                item["hit_rate"] = item["hits"] / total if total else 0.0
+                item["fetch_latency"] = self._latency.get(frequency, LatencyHistogram()).to_dict()
+                frequencies[frequency] = item
+            return OrderedDict([("backend", self._backend), ("frequencies", frequencies)])
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
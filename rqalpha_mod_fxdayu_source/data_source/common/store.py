@@ -0,0 +1,147 @@
+# encoding: utf-8
+import os
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+from rqalpha.utils.datetime_func import convert_dt_to_int
+from rqalpha.utils.logger import system_log
+
+
+def get_shared_memory_dir():
+    """
+    Directory backed by memory and visible to all processes on this host, ``/dev/shm`` on linux.
+    """
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm"
+    system_log.warning("/dev/shm 不存在, 共享缓存将使用临时目录: {}".format(tempfile.gettempdir()))
+    return tempfile.gettempdir()
+
+
+class DiskBarsStore(object):
+    """
+    Persistent store of fetched bars on local disk. Every request is saved as a ``.npy`` file
+    keyed by (order_book_id, frequency, date range, fields), which is loaded back as a read-only memory map.
+
+    If max_space is given, the files found under root are counted as well as the files saved later,
+    and the oldest files by modification time are deleted once they exceed max_space.
+    """
+
+    def __init__(self, root, max_space=None):
+        self._root = os.path.expanduser(root)
+        self._max_space = max_space
+        self._files = OrderedDict()  # path: ((order_book_id, frequency), nbytes)
+        self._space = 0
+        if max_space is not None:
+            self._scan()
+
+    @property
+    def root(self):
+        return self._root
+
+    @property
+    def space(self):
+        return self._space
+
+    def _scan(self):
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self._root):
+            for filename in filenames:
+                if not filename.endswith(".npy"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                order_book_id = os.path.basename(dirpath)
+                frequency = os.path.basename(os.path.dirname(dirpath))
+                files.append((stat.st_mtime, path, (order_book_id, frequency), stat.st_size))
+        for mtime, path, key, nbytes in sorted(files):
+            self._files[path] = (key, nbytes)
+            self._space += nbytes
+        self._evict()
+
+    def _get_path(self, order_book_id, frequency, start_dt=None, end_dt=None, length=None, fields=None):
+        name = "%s_%s_%s.npy" % (
+            convert_dt_to_int(start_dt) if start_dt else 0,
+            convert_dt_to_int(end_dt) if end_dt else 0,
+            length or 0,
+        )
+        if fields is not None:
+            name = "%s_%s" % ("-".join(fields), name)
+        return os.path.join(self._root, frequency, order_book_id, name)
+
+    def load(self, order_book_id, frequency, start_dt=None, end_dt=None, length=None, fields=None):
+        path = self._get_path(order_book_id, frequency, start_dt, end_dt, length, fields)
+        try:
+            return np.load(path, mmap_mode="r")
+        except (IOError, ValueError):
+            return None
+
+    def save(self, bars, order_book_id, frequency, start_dt=None, end_dt=None, length=None, fields=None):
+        """
+        Returns
+        -------
+        str: Path of the file saved, None if failed.
+        """
+        path = self._get_path(order_book_id, frequency, start_dt, end_dt, length, fields)
+        tmp = "%s.%s.tmp" % (path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                np.save(f, np.ascontiguousarray(bars))
+            os.replace(tmp, path)  # readers in other processes never see a partial file
+        except (IOError, OSError) as e:
+            system_log.warning("缓存写入磁盘失败: {}".format(e))
+            return None
+        if self._max_space is not None:
+            self._add(path, (order_book_id, frequency))
+        return path
+
+    def _add(self, path, key):
+        if path in self._files:
+            self._space -= self._files.pop(path)[1]
+        nbytes = os.path.getsize(path)
+        self._files[path] = (key, nbytes)
+        self._space += nbytes
+        self._evict()
+
+    def _evict(self):
+        while self._space > self._max_space and self._files:
+            self._delete(next(iter(self._files)))
+
+    def _delete(self, path):
+        self._space -= self._files.pop(path)[1]
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class SharedBarsStore(DiskBarsStore):
+    """
+    DiskBarsStore in shared memory, bounded by the bytes of the files saved by this process. Those files are
+    deleted oldest first once they exceed max_space, with their cache when it is evicted, and all at release.
+    Processes that have mapped a deleted file keep reading it.
+    """
+
+    def __init__(self, root, max_space):
+        super(SharedBarsStore, self).__init__(root)
+        # files of other processes are not scanned
+        self._max_space = max_space
+
+    def remove(self, order_book_id, frequency):
+        """
+        Delete the files of (order_book_id, frequency) saved by this process.
+        """
+        key = (order_book_id, frequency)
+        for path in [path for path, (key_, nbytes) in self._files.items() if key_ == key]:
+            self._delete(path)
+
+    def release(self):
+        """
+        Delete all files saved by this process.
+        """
+        for path in list(self._files):
+            self._delete(path)
@@ -1,13 +1,13 @@
 # encoding: utf-8
-from datetime import date, datetime, time
+from datetime import date
+from weakref import WeakKeyDictionary
 
 import motor.motor_asyncio
 import numpy as np
-import pandas as pd
 from dateutil.relativedelta import relativedelta
 from rqalpha.const import INSTRUMENT_TYPE
 from rqalpha.model.instrument import Instrument
-from rqalpha.utils.datetime_func import convert_date_to_int
+from rqalpha.utils.datetime_func import convert_int_to_datetime
 from rqalpha.utils.py2 import lru_cache
 
 from rqalpha_mod_fxdayu_source.data_source.common import CacheMixin
@@ -15,7 +15,7 @@ from rqalpha_mod_fxdayu_source.data_source.common.minite import MiniteBarDataSou
 from rqalpha_mod_fxdayu_source.data_source.common.odd import OddFrequencyBaseDataSource
 from rqalpha_mod_fxdayu_source.utils import Singleton
 from rqalpha_mod_fxdayu_source.utils.asyncio import get_asyncio_event_loop
-from rqalpha_mod_fxdayu_source.utils.converter import DataFrameConverter
+from rqalpha_mod_fxdayu_source.utils.converter import MongoConverter
 
 INSTRUMENT_TYPE_MAP = {
     INSTRUMENT_TYPE.CS: "stock",
@@ -34,9 +34,21 @@ class MongoDataSource(OddFrequencyBaseDataSource, MiniteBarDataSourceMixin):
         super(MongoDataSource, self).__init__(path)
         from rqalpha_mod_fxdayu_source.share.mongo_handler import MongoHandler
         self._handler = MongoHandler(mongo_url)
-        self._client = motor.motor_asyncio.AsyncIOMotorClient(mongo_url)
+        self._mongo_url = mongo_url
+        self._clients = WeakKeyDictionary()
         self._db_map = self._get_frequency_db_map()
 
+    def _get_client(self):
+        # motor client is bound to the event loop of the thread it was created in,
+        # keep one for each loop so that bars can be read in other threads.
+        loop = get_asyncio_event_loop()
+        try:
+            return self._clients[loop]
+        except KeyError:
+            client = motor.motor_asyncio.AsyncIOMotorClient(self._mongo_url)
+            self._clients[loop] = client
+            return client
+
     def _get_frequency_db_map(self):
         map_ = self._handler.client.get_database("meta").get_collection("db_map").find()
         dct = {item["type"]: item["map"] for item in map_}
@@ -54,59 +66,84 @@ class MongoDataSource(OddFrequencyBaseDataSource, MiniteBarDataSourceMixin):
             message = instrument.order_book_id if isinstance(instrument, Instrument) else instrument
             raise NoneDataError("MongoDB 中没有品种%s的%s数据" % (message, frequency))
 
-    async def _do_get_bars(self, db, collection, filters, projection, fill=np.NaN):
-        dct = {}
-        l = 0
-        async for doc in self._client[db][collection].find(filters, projection):
-            _l = doc.pop('_l')
-            l += _l
-            for key, values in doc.items():
-                if isinstance(values, list) and (len(values) == _l):
-                    dct.setdefault(key, []).extend(values)
-            for values in dct.values():
-                if len(values) != l:
-                    values.extend([fill] * l)
-        df = pd.DataFrame(dct)
-        if df.size:
-            return df.sort_values("datetime")
+    async def _do_get_bars(self, db, collection, filters, projection, fields=None, fill=np.NaN):
+        docs = await self._get_client()[db][collection].find(filters, projection).to_list(None)
+        if docs:
+            return MongoConverter.docs2np(docs, fields, fill)
         else:
             return None
 
-    def _get_bars_in_days(self, instrument, frequency, params):
-        s_date = params[0]["trade_date"]
-        e_date = params[-1]["trade_date"]
-        s_time = params[0]["start_time"] if "start_time" in params[0] else 0
-        e_time = params[-1]["end_time"] if "end_time" in params[-1] else 150000
-        s_dt_int = convert_date_to_int(s_date) + s_time
-        e_dt_int = convert_date_to_int(e_date) + e_time
+    @staticmethod
+    def _get_projection(fields):
+        """
+        Projection of the documents of bars, fields besides datetime are all read if None.
+        """
+        if fields is None:
+            return {"_id": 0, "_d": 0}
+        projection = {"_id": 0, "_l": 1, "datetime": 1}
+        projection.update((field, 1) for field in fields)
+        return projection
+
+    async def _async_get_bars_in_days(self, instrument, frequency, plan, fields=None):
+        fields_ = ["datetime"] + list(fields) if fields is not None else None
+        if not len(plan.days):
+            return MongoConverter.empty(fields_)
         db = self._get_db(instrument=instrument, frequency=frequency)
         collection = instrument.order_book_id
-        filters = {"_d": {"$gte": datetime.combine(s_date, time=time()), "$lte": datetime.combine(e_date, time=time())}}
-        projection = {"_id": 0, "_d": 0}
-        loop = get_asyncio_event_loop()
-        bars = loop.run_until_complete(self._do_get_bars(db, collection, filters, projection))
-        if bars is not None and bars.size:
-            bars = DataFrameConverter.df2np(bars)
-        else:
-            bars = DataFrameConverter.empty()
-        s_pos = np.searchsorted(bars["datetime"], s_dt_int)
-        e_pos = np.searchsorted(bars["datetime"], e_dt_int, side="right")
+        # documents of all days are read by one range query
+        filters = {"_d": {"$gte": convert_int_to_datetime(plan.days[0]),
+                          "$lte": convert_int_to_datetime(plan.days[-1])}}
+        bars = await self._do_get_bars(db, collection, filters, self._get_projection(fields), fields_)
+        if bars is None:
+            bars = MongoConverter.empty(fields_)
+        s_pos = np.searchsorted(bars["datetime"], plan.start)
+        e_pos = np.searchsorted(bars["datetime"], plan.end, side="right")
         return bars[s_pos:e_pos]
 
-    def raw_history_bars(self, instrument, frequency, start_dt=None, end_dt=None, length=None):
+    async def _async_row_bars(self, instrument, frequency, start_dt=None, end_dt=None, length=None, fields=None):
+        """
+        Read daily or hour bars, which are stored one bar per document and indexed by datetime.
+        """
+        fields_ = ["datetime"] + list(fields) if fields is not None else None
+        db = self._get_db(instrument, frequency)
+        pipeline = []
+        filters = {}
+        if start_dt:
+            filters["$gte"] = start_dt
+        if end_dt:
+            filters["$lte"] = end_dt
+        if filters:
+            pipeline.append({"$match": {"datetime": filters}})
+        if length and not start_dt:
+            # the last bars, turned back to ascending order by the server
+            pipeline.extend([{"$sort": {"datetime": -1}}, {"$limit": length}, {"$sort": {"datetime": 1}}])
+        else:
+            pipeline.append({"$sort": {"datetime": 1}})
+            if length and not end_dt:
+                pipeline.append({"$limit": length})
+        projection = {"_id": 0}
+        if fields_ is not None:
+            projection.update((field, 1) for field in fields_)
+        pipeline.append({"$project": projection})
+        docs = await self._get_client()[db][instrument.order_book_id].aggregate(pipeline).to_list(None)
+        return MongoConverter.rows2np(docs, fields_)
+
+    def raw_history_bars(self, instrument, frequency, start_dt=None, end_dt=None, length=None, fields=None):
         # 转换到自建mongodb结构s
         if frequency.endswith("m"):
             return MiniteBarDataSourceMixin.raw_history_bars(
-                self, instrument, frequency, start_dt=start_dt, end_dt=end_dt, length=length)
+                self, instrument, frequency, start_dt=start_dt, end_dt=end_dt, length=length, fields=fields)
         else:
-            code = instrument.order_book_id
-            db = self._get_db(instrument, frequency)
-            data = self._handler.read(code, db=db, start=start_dt, end=end_dt, length=length, sort=[("datetime", 1)]). \
-                reset_index()
-            if data is not None and data.size:
-                return DataFrameConverter.df2np(data)
-            else:
-                return DataFrameConverter.empty()
+            loop = get_asyncio_event_loop()
+            return loop.run_until_complete(
+                self._async_row_bars(instrument, frequency, start_dt, end_dt, length, fields))
+
+    def _async_raw_history_bars(self, instrument, frequency, start_dt=None, end_dt=None, length=None, fields=None):
+        if frequency.endswith("m"):
+            return MiniteBarDataSourceMixin._async_raw_history_bars(
+                self, instrument, frequency, start_dt=start_dt, end_dt=end_dt, length=length, fields=fields)
+        else:
+            return self._async_row_bars(instrument, frequency, start_dt, end_dt, length, fields)
 
     def is_base_frequency(self, instrument, frequency):
         if isinstance(instrument, Instrument):
@@ -120,19 +157,16 @@ class MongoDataSource(OddFrequencyBaseDataSource, MiniteBarDataSourceMixin):
         pass
 
     def _get_date_range(self, frequency):
-        from pymongo import DESCENDING
         try:
             db = self._get_db(INSTRUMENT_TYPE.CS, frequency)
         except NoneDataError:
             db = self._get_db(INSTRUMENT_TYPE.CS, "1" + frequency[-1])
         key = "_d" if frequency.endswith("m") else "datetime"
-        try:
-            start = self._handler.client.get_database(db).get_collection("600000.XSHG").find() \
-                .sort(key).limit(1)[0][key]
-            end = self._handler.client.get_database(db).get_collection("600000.XSHG").find() \
-                .sort(key, direction=DESCENDING).limit(1)[0][key]
-        except IndexError:
+        # 范围记录在meta.date_range中, 由写入数据时增量更新
+        date_range = self._handler.get_date_range(db, key)
+        if date_range is None:
             raise RuntimeError("无法从MongoDb获取数据时间范围")
+        start, end = date_range
         return start.date(), end.date()
 
     @lru_cache(maxsize=10)
@@ -143,6 +177,9 @@ class MongoDataSource(OddFrequencyBaseDataSource, MiniteBarDataSourceMixin):
 
 
 class MongoCacheDataSource(MongoDataSource, CacheMixin):
+    # every thread reads with a motor client of its own event loop
+    THREAD_SAFE = True
+
     def __init__(self, path, mongo_url):
         super(MongoCacheDataSource, self).__init__(path, mongo_url)
         CacheMixin.__init__(self)
@@ -1,3 +1,6 @@
+import functools
+import queue
+import threading
 from datetime import date
 
 import asyncio
@@ -11,10 +14,9 @@ from rqalpha_mod_fxdayu_source.data_source.common import CacheMixin
 from rqalpha_mod_fxdayu_source.data_source.common.minite import safe_searchsorted, MiniteBarDataSourceMixin
 from rqalpha_mod_fxdayu_source.data_source.common.odd import OddFrequencyBaseDataSource
 from rqalpha_mod_fxdayu_source.utils import Singleton
-from rqalpha_mod_fxdayu_source.utils.asyncio import get_asyncio_event_loop
 from rqalpha_mod_fxdayu_source.utils.converter import QuantOsConverter
 from rqalpha_mod_fxdayu_source.utils.instrument import instrument_to_tushare
-from rqalpha_mod_fxdayu_source.utils.quantos import QuantOsDataApiMixin
+from rqalpha_mod_fxdayu_source.utils.quantos import QuantOsDataApiMixin, new_api
 
 
 class QuantOsSource(OddFrequencyBaseDataSource, MiniteBarDataSourceMixin, QuantOsDataApiMixin):
@@ -23,31 +25,78 @@ class QuantOsSource(OddFrequencyBaseDataSource, MiniteBarDataSourceMixin, QuantO
     def __init__(self, path, api_url=None, user=None, token=None):
         super(QuantOsSource, self).__init__(path)
         QuantOsDataApiMixin.__init__(self, api_url, user, token)
+        # DataApi is not thread safe, while the cache may read ahead in background
+        self._api_lock = threading.RLock()
+        # idle connections for the bars of days queried concurrently, one DataApi per query in flight
+        self._bar_apis = queue.Queue()
+        self._bar_api_count = 0
 
-    async def _get_bars_in_day(self, instrument=None, frequency=None, trade_date=None, start_time=0, end_time=150000):
+    @staticmethod
+    def _get_api_fields(fields, *keys):
+        """
+        Columns to query from the api, "" for all of them.
+        """
+        if fields is None:
+            return ""
+        return ",".join(list(keys) + [field for field in fields if field not in keys])
+
+    def _borrow_bar_api(self):
+        try:
+            return self._bar_apis.get_nowait()
+        except queue.Empty:
+            pass
+        with self._api_lock:
+            create = self._bar_api_count < (self.MAX_CONCURRENT_REQUESTS or 1)
+            if create:
+                self._bar_api_count += 1
+        if not create:
+            return self._bar_apis.get()
+        try:
+            return new_api()
+        except Exception:
+            with self._api_lock:
+                self._bar_api_count -= 1
+            raise
+
+    def _query_bars(self, **kwargs):
+        api = self._borrow_bar_api()
+        try:
+            return api.bar(**kwargs)
+        finally:
+            self._bar_apis.put(api)
+
+    async def _get_bars_in_day(self, instrument=None, frequency=None, trade_date=None, start_time=0, end_time=150000,
+                               fields=None):
         # TODO retry when net error occurs
         symbol = instrument_to_tushare(instrument)
-        trade_date = convert_date_to_int(trade_date) // 1000000
+        trade_date = trade_date // 1000000
         start_time = max(start_time, 80000)
         end_time = min(end_time, 160000)
-        return self._api.bar(symbol=symbol, freq=frequency[:-1] + frequency[-1].upper(),
-                             trade_date=trade_date, start_time=start_time, end_time=end_time)
+        # the blocking call runs in the executor, so queries of other days go on meanwhile
+        query = functools.partial(self._query_bars, symbol=symbol, freq=frequency[:-1] + frequency[-1].upper(),
+                                  trade_date=trade_date, start_time=start_time, end_time=end_time,
+                                  fields=self._get_api_fields(fields, "trade_date", "time"))
+        return await asyncio.get_event_loop().run_in_executor(None, query)
 
-    def _get_bars_in_days(self, instrument, frequency, days):
-        loop = get_asyncio_event_loop()
-        tasks = [self._get_bars_in_day(instrument=instrument, frequency=frequency, **day) for day in days]
-        results = loop.run_until_complete(asyncio.gather(*tasks))
+    async def _async_get_bars_in_days(self, instrument, frequency, plan, fields=None):
+        fields_ = ["datetime"] + list(fields) if fields is not None else None
+        if not len(plan.days):
+            return QuantOsConverter.empty(fields_)
+        # the api serves bars of one trading day per call
+        tasks = [self._get_bars_in_day(instrument, frequency, day, start_time, end_time, fields)
+                 for day, start_time, end_time in plan.sections()]
+        results = await asyncio.gather(*tasks)
         dfs, msgs = zip(*results)
         for msg in msgs:
             if msg and msg != "0,":
                 raise RuntimeError(msg)
         bars = pd.concat(dfs, axis=0)
         if bars is not None and bars.size:
-            return QuantOsConverter.df2np(bars)
+            return QuantOsConverter.df2np(bars, fields_)
         else:
-            return QuantOsConverter.empty()
+            return QuantOsConverter.empty(fields_)
 
-    def raw_history_bars(self, instrument, frequency, start_dt=None, end_dt=None, length=None):
+    def raw_history_bars(self, instrument, frequency, start_dt=None, end_dt=None, length=None, fields=None):
         symbol = instrument_to_tushare(instrument)
         if frequency in ["1d"]:
             if start_dt and end_dt:
@@ -67,19 +116,22 @@ class QuantOsSource(OddFrequencyBaseDataSource, MiniteBarDataSourceMixin, QuantO
                 e_date_int = int(dates[e_pos - 1])
             else:
                 raise RuntimeError("At least two of [start_dt,end_dt,length] should be given.")
-            data, msg = self._api.daily(symbol, freq=frequency, adjust_mode=None,
-                                        start_date=s_date_int // 1000000,
-                                        end_date=e_date_int // 1000000)
+            with self._api_lock:
+                data, msg = self._api.daily(symbol, freq=frequency, adjust_mode=None,
+                                            start_date=s_date_int // 1000000,
+                                            end_date=e_date_int // 1000000,
+                                            fields=self._get_api_fields(fields, "trade_date", "volume"))
+            fields_ = ["datetime"] + list(fields) if fields is not None else None
             if isinstance(data, pd.DataFrame) and data.size:
                 data = data[data["volume"] > 0]  # TODO sikp_suspended?
-                return QuantOsConverter.df2np(data)
+                return QuantOsConverter.df2np(data, fields_)
             else:
                 if msg:
                     system_log.warning(msg)
-                return QuantOsConverter.empty()
+                return QuantOsConverter.empty(fields_)
         else:
             return MiniteBarDataSourceMixin.raw_history_bars(
-                self, instrument, frequency, start_dt=start_dt, end_dt=end_dt, length=length
+                self, instrument, frequency, start_dt=start_dt, end_dt=end_dt, length=length, fields=fields
             )
 
     def is_base_frequency(self, instrument, frequency):
@@ -94,6 +146,9 @@ class QuantOsSource(OddFrequencyBaseDataSource, MiniteBarDataSourceMixin, QuantO
 
 
 class QuantOsCacheSource(QuantOsSource, CacheMixin):
+    # every DataApi is used by one thread at a time
+    THREAD_SAFE = True
+
     def __init__(self, *args, **kwargs):
         super(QuantOsCacheSource, self).__init__(*args, **kwargs)
         CacheMixin.__init__(self)
@@ -2,13 +2,15 @@
 from datetime import datetime
 
 from rqalpha.const import RUN_TYPE, PERSIST_MODE
+from rqalpha.events import EVENT
 from rqalpha.interface import AbstractMod
 from rqalpha.utils.disk_persist_provider import DiskPersistProvider
 from rqalpha.utils.i18n import gettext as _
 from rqalpha.utils.logger import user_system_log, system_log
 
 from rqalpha_mod_fxdayu_source.const import DataSourceType
-from rqalpha_mod_fxdayu_source.data_source.common import CacheMixin
+from rqalpha_mod_fxdayu_source.data_source.common import CacheMixin, MiniteBarDataSourceMixin, \
+    OddFrequencyDataSource
 from rqalpha_mod_fxdayu_source.data_source.common.realtime import RealtimeDataSource
 from rqalpha_mod_fxdayu_source.event_source import IntervalEventSource, RealTimeEventSource
 from rqalpha_mod_fxdayu_source.inday_bars.quantos import QuantOsIndayBars
@@ -20,8 +22,20 @@ class FxdayuSourceMod(AbstractMod):
     def __init__(self):
         self._old_cache_length = CacheMixin.CACHE_LENGTH
         self._old_max_cache_space = CacheMixin.MAX_CACHE_SPACE
+        self._old_cache_path = CacheMixin.CACHE_PATH
+        self._old_max_cache_path_space = CacheMixin.MAX_CACHE_PATH_SPACE
+        self._old_prefetch_threshold = CacheMixin.PREFETCH_THRESHOLD
+        self._old_shared_cache = CacheMixin.SHARED_CACHE
+        self._old_max_concurrent_requests = MiniteBarDataSourceMixin.MAX_CONCURRENT_REQUESTS
+        self._old_resample_cache = OddFrequencyDataSource.RESAMPLE_CACHE
+        self._old_adjust_cache = OddFrequencyDataSource.ADJUST_CACHE
+        self._old_max_memo_space = OddFrequencyDataSource.MAX_MEMO_SPACE
+        self._env = None
+        self._cache_source = None
+        self._cache_report_path = None
 
     def start_up(self, env, mod_config):
+        self._env = env
         env.set_price_board(StockLimitUpDownPriceBoard())
         type_ = DataSourceType(mod_config.source)
         if type_ in [DataSourceType.MONGO, DataSourceType.REAL_TIME]:
@@ -44,7 +58,26 @@ class FxdayuSourceMod(AbstractMod):
                 CacheMixin.set_cache_length(int(mod_config.cache_length))
             if mod_config.max_cache_space:
                 CacheMixin.set_max_cache_space(int(mod_config.max_cache_space))
+            if mod_config.cache_path:
+                CacheMixin.set_cache_path(mod_config.cache_path)
+            if mod_config.max_cache_path_space:
+                CacheMixin.set_max_cache_path_space(int(mod_config.max_cache_path_space))
+            if mod_config.cache_prefetch_threshold is not None:
+                CacheMixin.set_prefetch_threshold(float(mod_config.cache_prefetch_threshold))
+            CacheMixin.set_shared_cache(bool(mod_config.cache_shared_memory))
+        if mod_config.max_concurrent_requests:
+            MiniteBarDataSourceMixin.set_max_concurrent_requests(int(mod_config.max_concurrent_requests))
+        OddFrequencyDataSource.set_resample_cache(bool(mod_config.enable_cache))
+        OddFrequencyDataSource.set_adjust_cache(bool(mod_config.enable_cache))
+        if mod_config.max_memo_space:
+            OddFrequencyDataSource.set_max_memo_space(int(mod_config.max_memo_space))
         data_source = data_source_cls(*args)
+        if mod_config.enable_cache:
+            self._cache_source = data_source
+            self._cache_report_path = mod_config.cache_report_path
+        if mod_config.enable_cache and mod_config.cache_warmup and env.config.base.frequency != "tick":
+            env.event_bus.add_listener(EVENT.BEFORE_TRADING, self._warmup_cache)
+            env.event_bus.add_listener(EVENT.POST_UNIVERSE_CHANGED, self._warmup_cache)
         mod_config.redis_uri = mod_config.redis_url  # fit rqalpha
         if env.config.base.run_type is RUN_TYPE.BACKTEST and env.config.base.persist_mode == PERSIST_MODE.ON_NORMAL_EXIT:
             # generate user context using backtest
@@ -84,6 +117,42 @@ class FxdayuSourceMod(AbstractMod):
                 env.config.base.start_date = trading_dates[max(0, pos - 1)].to_pydatetime().date()
         env.set_event_source(event_source)
 
+    def _warmup_cache(self, event):
+        env = self._env
+        if env.calendar_dt is None:
+            return
+        instruments = [env.get_instrument(order_book_id) for order_book_id in env.get_universe()]
+        self._cache_source.warmup_cache([i for i in instruments if i is not None],
+                                        env.config.base.frequency, env.calendar_dt)
+
+    @property
+    def cache_report(self):
+        if self._cache_source is None:
+            return None
+        return self._cache_source.cache_stats.report()
+
+    def _report_cache(self):
+        report = self.cache_report
+        for frequency, item in report["frequencies"].items():
+            system_log.info("缓存统计[{}]频率[{}]: 命中{}次,未命中{}次,命中率{:.2%},回源{}次,磁盘命中{}次,淘汰{}次,"
+                            "读取{}字节,回源耗时{:.3f}秒".format(
+                report["backend"], frequency, item["hits"], item["misses"], item["hit_rate"], item["refills"],
+                item["disk_hits"], item["evictions"], item["bytes_loaded"], item["fetch_latency"]["total"]))
+        if self._cache_report_path:
+            self._cache_source.cache_stats.dump(self._cache_report_path)
+
     def tear_down(self, code, exception=None):
         CacheMixin.set_cache_length(self._old_cache_length)
         CacheMixin.set_max_cache_space(self._old_max_cache_space)
+        CacheMixin.set_cache_path(self._old_cache_path)
+        CacheMixin.set_max_cache_path_space(self._old_max_cache_path_space)
+        CacheMixin.set_prefetch_threshold(self._old_prefetch_threshold)
+        CacheMixin.set_shared_cache(self._old_shared_cache)
+        MiniteBarDataSourceMixin.set_max_concurrent_requests(self._old_max_concurrent_requests)
+        OddFrequencyDataSource.set_resample_cache(self._old_resample_cache)
+        OddFrequencyDataSource.set_adjust_cache(self._old_adjust_cache)
+        OddFrequencyDataSource.set_max_memo_space(self._old_max_memo_space)
+        if self._cache_source is not None:
+            self._cache_source.stop_read_ahead()
+            self._cache_source.release_shared_cache()
+            self._report_cache()
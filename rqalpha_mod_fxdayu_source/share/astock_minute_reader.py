@@ -267,5 +267,33 @@ class AStockBcolzMinuteBarReader(BcolzMinuteBarReader):
             results.append(out)
         return results
 
+    def load_raw_arrays_before(self, instruments, end_dt, length, fields=None):
+        """
+        Load raw arrays of the latest length trading minutes until end_dt from bundles.
+
+        Parameters
+        ----------
+        instruments:
+            list of instrument, The asset identifiers in the window.
+        end_dt: datetime
+            End of the window range.
+        length:
+            Length of the window range.
+        fields : list of str
+            'open', 'high', 'low', 'close', or 'volume'
+
+        Returns
+        -------
+        tuple: uint64 datetimes of the minutes in YYYYMMDDHHMMSS format, and the list of ndarrays
+        returned by load_raw_arrays.
+        """
+        start_idx, end_idx = self.get_dt_slice(None, end_dt=end_dt, length=length, skip_suspended=False)
+        minutes = self._minute_index[start_idx:end_idx]
+        if not len(minutes):
+            return np.empty((0,), dtype=np.uint64), [np.empty((0, len(instruments))) for _ in fields or self.FIELDS]
+        arrays = self.load_raw_arrays(instruments, start_dt=minutes[0], end_dt=minutes[-1], fields=fields)
+        datetimes = np.array(list(map(convert_dt_to_int, minutes.to_pydatetime())), dtype=np.uint64)
+        return datetimes, arrays
+
     def available_data_range(self):
         return self.calendar.first_session.to_pydatetime().date(), self.calendar.last_session.to_pydatetime().date()
@@ -1,5 +1,6 @@
 # encoding:utf-8
 from pymongo.mongo_client import database
+from pymongo import InsertOne, ReplaceOne, UpdateOne
 import pandas as pd
 import pymongo
 
@@ -25,9 +26,13 @@ class DataHandler(object):
 
 
 class MongoHandler(DataHandler):
-    def __init__(self, host='localhost', port=27017, users=None, db=None, **kwargs):
+    META_DB = 'meta'
+    DATE_RANGE_COLLECTION = 'date_range'
+
+    def __init__(self, host='localhost', port=27017, users=None, db=None, batch_size=1000, **kwargs):
         self.client = pymongo.MongoClient(host, port, **kwargs)
         self.db = self.client[db] if db else None
+        self.batch_size = batch_size
 
         if isinstance(users, dict):
             for db in users:
@@ -44,20 +49,34 @@ class MongoHandler(DataHandler):
             else:
                 return self.client[db][collection]
 
-    def write(self, data, collection, db=None, index=None):
+    def _bulk_write(self, collection, requests, ordered=True):
+        """
+        分批执行bulk_write
+
+        :param collection(Collection): 表
+        :param requests(list): InsertOne, ReplaceOne, UpdateOne等写操作
+        :param ordered(bool): False时不保证执行顺序, 出错不中断, 服务端可并行写入
+        :return:
+        """
+        for i in range(0, len(requests), self.batch_size):
+            collection.bulk_write(requests[i:i + self.batch_size], ordered=ordered)
+
+    def write(self, data, collection, db=None, index=None, ordered=False):
         """
 
         :param data(DataFrame|list(dict)): 要存的数据
         :param collection(str): 表名
         :param db(str): 数据库名
         :param index(str): 以index值建索引, None不建索引
+        :param ordered(bool): 是否按顺序写入, 默认False, 不保证写入顺序, 出错不中断
         :return:
         """
         collection = self._locate(collection, db)
         data = self.normalize(data, index)
-        collection.insert_many(data)
+        self._bulk_write(collection, [InsertOne(doc) for doc in data], ordered)
         if index:
             collection.create_index(index)
+            self._extend_date_range(collection, data, index)
         return {'collection': collection.name, 'start': data[0], 'end': data[-1]}
 
     def read(self, collection, db=None, index='datetime', start=None, end=None, length=None, **kwargs):
@@ -128,36 +147,42 @@ class MongoHandler(DataHandler):
         data.pop('_id')
         return data
 
-    def inplace(self, data, collection, db=None, index='datetime'):
+    def inplace(self, data, collection, db=None, index='datetime', ordered=False):
         """
         以替换的方式存(存入不重复)
+        按index逐条upsert后再删除区间内多余的数据, 读取时不会出现数据缺失的窗口
 
         :param data(DataFrame|list(dict)): 要存的数据
         :param collection(str): 表名
         :param db(str): 数据库名
         :param index(str): 默认以datetime为索引替换
+        :param ordered(bool): 是否按顺序写入, 默认False, 不保证写入顺序, 出错不中断
         :return:
         """
 
         collection = self._locate(collection, db)
         data = self.normalize(data, index)
 
-        collection.delete_many({index: {'$gte': data[0][index], '$lte': data[-1][index]}})
-        collection.insert_many(data)
         collection.create_index(index)
+        self._bulk_write(collection, [ReplaceOne({index: doc[index]}, doc, upsert=True) for doc in data], ordered)
+        keys = [doc[index] for doc in data]
+        collection.delete_many({index: {'$gte': min(keys), '$lte': max(keys), '$nin': keys}})
+        self._extend_date_range(collection, data, index)
         return {'collection': collection.name, 'start': data[0], 'end': data[-1]}
 
-    def update(self, data, collection, db=None, index='datetime', how='$set'):
+    def update(self, data, collection, db=None, index='datetime', how='$set', ordered=False):
         collection = self._locate(collection, db)
 
         if isinstance(data, pd.DataFrame):
-            if index in data.columns:
-                data.index = data[index]
-            for name, doc in data.iterrows():
-                collection.update_one({index: name}, {how: doc.to_dict()})
+            keys = data[index] if index in data.columns else data.index
+            requests = [UpdateOne({index: key}, {how: doc})
+                        for key, doc in zip(keys.tolist(), data.to_dict('records'))]
         else:
+            requests = []
             for doc in data:
-                collection.update_one({index: doc.pop(index)}, doc)
+                doc = dict(doc)
+                requests.append(UpdateOne({index: doc.pop(index)}, doc))
+        self._bulk_write(collection, requests, ordered)
 
     def delete(self, filter, collection, db=None):
         collection = self._locate(collection, db)
@@ -165,12 +190,14 @@ class MongoHandler(DataHandler):
 
     def normalize(self, data, index=None):
         if isinstance(data, pd.DataFrame):
+            docs = data.to_dict('records')
             if index and (index not in data.columns):
-                data[index] = data.index
-            return [doc[1].to_dict() for doc in data.iterrows()]
+                for doc, key in zip(docs, data.index.tolist()):
+                    doc[index] = key
+            return docs
         elif isinstance(data, dict):
-            key, value = list(map(lambda *args: args, *data.iteritems()))
-            return list(map(lambda *args: dict(map(lambda x, y: (x, y), key, args)), *value))
+            keys = list(data.keys())
+            return [dict(zip(keys, values)) for values in zip(*data.values())]
         elif isinstance(data, pd.Series):
             if data.name is None:
                 raise ValueError('name of series: data is None')
@@ -182,8 +209,66 @@ class MongoHandler(DataHandler):
         else:
             return data
 
+    def _get_date_range_collection(self):
+        return self.client[self.META_DB][self.DATE_RANGE_COLLECTION]
+
+    def get_date_range(self, db, index='datetime'):
+        """
+        读取meta中记录的db内所有表index的最小值和最大值, 记录随本类的写入扩展,
+        没有记录时调用refresh_date_range逐表计算并记录, 不经过本类写入的数据需要调用refresh_date_range更新
+
+        :param db(str): 数据库名
+        :param index(str): 时间索引
+        :return: (start, end), db中没有数据时为None
+        """
+        doc = self._get_date_range_collection().find_one({'db': db, 'index': index})
+        if doc is not None:
+            return doc['start'], doc['end']
+        return self.refresh_date_range(db, index)
+
+    def refresh_date_range(self, db, index='datetime'):
+        """
+        逐表按索引查询首尾数据, 更新meta中db的时间范围, 以包含不经过本类写入的数据,
+        已有记录时每张表只查询早于记录起点和晚于记录终点的各一条
+
+        :param db(str): 数据库名
+        :param index(str): 时间索引
+        :return: (start, end), db中没有数据时为None
+        """
+        meta = self._get_date_range_collection()
+        doc = meta.find_one({'db': db, 'index': index})
+        start, end = (doc['start'], doc['end']) if doc else (None, None)
+        projection = {'_id': 0, index: 1}
+        for name in self.table_names(db):
+            if name.startswith('system.'):
+                continue
+            collection = self.client[db][name]
+            first = collection.find_one({index: {'$lt': start} if start is not None else {'$ne': None}},
+                                        projection, sort=[(index, 1)])
+            if first is not None:
+                start = first[index]
+            last = collection.find_one({index: {'$gt': end} if end is not None else {'$ne': None}},
+                                       projection, sort=[(index, -1)])
+            if last is not None:
+                end = last[index]
+        if start is None:
+            return None
+        if doc is None or (start, end) != (doc['start'], doc['end']):
+            meta.update_one({'db': db, 'index': index}, {'$min': {'start': start}, '$max': {'end': end}},
+                            upsert=True)
+        return start, end
+
+    def _extend_date_range(self, collection, data, index):
+        # 只扩展已有的记录, 没有记录时由get_date_range完整计算
+        keys = [doc[index] for doc in data if doc.get(index) is not None]
+        if keys:
+            self._get_date_range_collection().update_one(
+                {'db': collection.database.name, 'index': index},
+                {'$min': {'start': min(keys)}, '$max': {'end': max(keys)}}
+            )
+
     def table_names(self, db=None):
         if not db:
-            return self.db.collection_names()
+            return self.db.list_collection_names()
         else:
-            return self.client[db].collection_names()
+            return self.client[db].list_collection_names()
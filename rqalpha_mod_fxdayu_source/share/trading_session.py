@@ -15,6 +15,14 @@ class TradingSession(with_metaclass(ABCMeta)):
     def sessions(self):
         raise NotImplementedError
 
+    @property
+    @abstractmethod
+    def start(self):
+        """
+        datetime.time: Time of the first bar in a trading day, which offsets of sessions count from.
+        """
+        raise NotImplementedError
+
     @property
     def minute_per_day(self):
         total = 0
@@ -24,6 +32,10 @@ class TradingSession(with_metaclass(ABCMeta)):
 
 
 class AStockTradingSession(TradingSession):
+    @property
+    def start(self):
+        return time(9, 31)
+
     @property
     def sessions(self):
         return [
@@ -8,3 +8,18 @@ def get_asyncio_event_loop():
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         return loop
+
+
+async def bounded_gather(coroutines, limit=None):
+    """
+    asyncio.gather with at most limit coroutines running at once, unbounded if limit is None.
+    """
+    if limit is None:
+        return await asyncio.gather(*coroutines)
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*[run(coroutine) for coroutine in coroutines])
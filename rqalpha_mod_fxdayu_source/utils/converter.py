@@ -6,6 +6,30 @@ from rqalpha.data.converter import StockBarConverter
 from rqalpha.utils.datetime_func import convert_dt_to_int, convert_int_to_datetime
 
 
+def convert_datetime64_to_int(datetimes):
+    """
+    Vectorized convert_dt_to_int.
+
+    Parameters
+    ----------
+    datetimes: numpy.ndarray
+        Array of numpy.datetime64.
+
+    Returns
+    -------
+    numpy.ndarray: Datetimes of uint64 in YYYYMMDDHHMMSS format.
+    """
+    datetimes = datetimes.astype("datetime64[s]")
+    days = datetimes.astype("datetime64[D]")
+    months = days.astype("datetime64[M]")
+    seconds = (datetimes - days).astype(np.int64)
+    months_ = months.astype(np.int64)
+    result = (months_ // 12 + 1970) * 10000000000 + (months_ % 12 + 1) * 100000000 + \
+        ((days - months).astype(np.int64) + 1) * 1000000 + \
+        seconds // 3600 * 10000 + seconds // 60 % 60 * 100 + seconds % 60
+    return result.astype(np.uint64)
+
+
 class DataFrameConverter(object):
     @classmethod
     def df2np(cls, df, fields=None):
@@ -46,3 +70,79 @@ class QuantOsConverter(DataFrameConverter):
             lambda x: datetime.strptime(str(x), "%Y%m%d%H%M%S")
         )
         return super(QuantOsConverter, cls).df2np(df, fields)
+
+
+class MongoConverter(DataFrameConverter):
+    @classmethod
+    def docs2np(cls, docs, fields=None, fill=np.nan):
+        """
+        Decode columnar documents of bars straight into one structured array. Every document holds
+        ``_l`` bars with a list of values per field, fields missing in a document are filled with fill.
+
+        Parameters
+        ----------
+        docs: list of dict
+            Documents of bars.
+        fields: list of str
+            Fields to decode, datetime, open, high, low, close and volume if None.
+        fill: float
+            Value of the missing fields.
+
+        Returns
+        -------
+        numpy.ndarray: Bars sorted by datetime.
+        """
+        if fields is None:
+            fields = ["datetime", "open", "high", "low", "close", "volume"]
+        result = np.empty((sum(doc["_l"] for doc in docs),), dtype=cls.empty(fields).dtype)
+        datetimes = []
+        start = 0
+        for doc in docs:
+            end = start + doc["_l"]
+            for field in fields:
+                values = doc.get(field)
+                if field == "datetime":
+                    datetimes.extend(values)
+                elif isinstance(values, list) and len(values) == doc["_l"]:
+                    result[field][start:end] = values
+                else:
+                    result[field][start:end] = fill
+            start = end
+        if "datetime" in fields:
+            # pandas parses datetime objects much faster than numpy does
+            result["datetime"] = convert_datetime64_to_int(pd.DatetimeIndex(datetimes).values)
+            # documents are not returned in order
+            if len(result) > 1 and (result["datetime"][1:] < result["datetime"][:-1]).any():
+                result = result[np.argsort(result["datetime"], kind="mergesort")]
+        return result
+
+    @classmethod
+    def rows2np(cls, docs, fields=None, fill=np.nan):
+        """
+        Decode documents holding one bar each, as daily and hour bars are stored, into one structured array.
+
+        Parameters
+        ----------
+        docs: list of dict
+            Documents of bars in order.
+        fields: list of str
+            Fields to decode, datetime, open, high, low, close and volume if None.
+        fill: float
+            Value of the missing or null fields.
+
+        Returns
+        -------
+        numpy.ndarray
+        """
+        if fields is None:
+            fields = ["datetime", "open", "high", "low", "close", "volume"]
+        result = np.empty((len(docs),), dtype=cls.empty(fields).dtype)
+        if not docs:
+            return result
+        for field in fields:
+            if field == "datetime":
+                result[field] = convert_datetime64_to_int(pd.DatetimeIndex([doc[field] for doc in docs]).values)
+            else:
+                values = [doc.get(field) for doc in docs]
+                result[field] = [fill if value is None else value for value in values]
+        return result
@@ -5,6 +5,7 @@ import functools
 from rqalpha.utils.logger import user_system_log
 
 _api = None
+_url = None
 _user = None
 _token = None
 _max_retry = 3
@@ -19,14 +20,14 @@ def ensure_api_login(func):
             return func(*args, **kwargs)
     return wrapper
 
-def api_login():
-    global _api
+def api_login(api=None):
+    api = api or _api
 
     retry = 0
     while retry < _max_retry:
         retry += 1
         try:
-            _, msg = _api.login(_user, _token)
+            _, msg = api.login(_user, _token)
             code = msg.split(",")[0]
             if code != "0":
                 raise QuantOsQueryError(msg)
@@ -39,17 +40,26 @@ def api_login():
             else:
                 time.sleep(retry)
 
+def new_api():
+    """
+    Another DataApi logged in with the same account, a DataApi must not be used by two threads at once.
+    """
+    from jaqs.data import DataApi
+    api = DataApi(addr=_url)
+    api_login(api)
+    return api
+
 class QuantOsQueryError(Exception):
     """Error occurrs when make query from quantos."""
 
 class QuantOsDataApiMixin(object):
     def __init__(self, api_url=None, user=None, token=None):
-        global _api, _user, _token
+        global _api, _url, _user, _token
         from jaqs.data import DataApi
         if _api is None:
-            url = api_url or os.environ.get("QUANTOS_URL", "tcp://data.quantos.org:8910")
+            _url = api_url or os.environ.get("QUANTOS_URL", "tcp://data.quantos.org:8910")
             _user = user or os.environ.get("QUANTOS_USER")
             _token = token or os.environ.get("QUANTOS_TOKEN")
-            _api = DataApi(addr=url)
+            _api = DataApi(addr=_url)
             api_login()
         self._api = _api
\ No newline at end of file
@@ -0,0 +1,266 @@
+# encoding: utf-8
+import numpy as np
+from rqalpha.data.converter import StockBarConverter
+
+RESAMPLE_FIELDS = ["datetime", "open", "high", "low", "close", "volume"]
+
+MINUTES_MAP = {
+    "m": 1,
+    "h": 60,
+}
+
+
+_session_tables = {}
+_bar_count_tables = {}
+
+
+def get_frequency_minutes(frequency):
+    """
+    Minutes of a bar of the minute or hour frequency.
+    """
+    return int(frequency[:-1]) * MINUTES_MAP[frequency[-1]]
+
+
+def get_session_bucket_table(session, num):
+    """
+    Lookup table from the minute of day to the minute of day of the last bar in its bucket. Buckets start
+    from the beginning of every trading session and the last bucket of a session ends with the session,
+    the same as the trading points of InDayTradingPointIndexer.
+
+    Minutes before the first session belong to its first bucket, and minutes after a session to its last bucket.
+
+    Parameters
+    ----------
+    session: rqalpha_mod_fxdayu_source.share.trading_session.TradingSession
+        Trading session of the instrument.
+    num: int
+        Minutes of a bucket.
+
+    Returns
+    -------
+    numpy.ndarray: Table of 1440 int64.
+    """
+    key = (session, num)
+    if key not in _session_tables:
+        first = session.start.hour * 60 + session.start.minute
+        table = np.empty((1440,), dtype=np.int64)
+        cursor = 0
+        last = None
+        for offset, number in session.sessions:
+            start = first + offset
+            end = start + number - 1
+            minutes = np.arange(start, end + 1)
+            table[start:end + 1] = np.minimum(start + ((minutes - start) // num + 1) * num - 1, end)
+            table[cursor:start] = table[start] if last is None else last
+            cursor = end + 1
+            last = end
+        table[cursor:] = last
+        _session_tables[key] = table
+    return _session_tables[key]
+
+
+def get_bar_count_table(session, num):
+    """
+    Lookup table from the minute of day to the count of bars of the trading session at or before it,
+    bars are labeled at the end of their buckets as get_session_bucket_table does.
+
+    Parameters
+    ----------
+    session: rqalpha_mod_fxdayu_source.share.trading_session.TradingSession
+        Trading session of the instrument.
+    num: int
+        Minutes of a bar.
+
+    Returns
+    -------
+    numpy.ndarray: Table of 1440 int64, bars between two minutes is the difference of them.
+    """
+    key = (session, num)
+    if key not in _bar_count_tables:
+        ends = np.unique(get_session_bucket_table(session, num))
+        _bar_count_tables[key] = ends.searchsorted(np.arange(1440), side="right")
+    return _bar_count_tables[key]
+
+
+def get_session_grid(dates, session, num):
+    """
+    Labels and datetimes of all buckets of the trading session in given trading dates.
+
+    Parameters
+    ----------
+    dates: numpy.ndarray
+        Sorted trading dates in YYYYMMDD format.
+    session: rqalpha_mod_fxdayu_source.share.trading_session.TradingSession
+        Trading session of the instrument.
+    num: int
+        Minutes of a bucket.
+
+    Returns
+    -------
+    tuple: Labels of int64 comparable with get_resample_labels, and datetimes of uint64 at the end of every bucket.
+    """
+    ends = np.unique(get_session_bucket_table(session, num))
+    dates = np.asarray(dates, dtype=np.int64)[:, None]
+    labels = (dates * 2880 + ends).ravel()
+    datetimes = (dates * 1000000 + ends // 60 * 10000 + ends % 60 * 100).ravel().astype(np.uint64)
+    return labels, datetimes
+
+
+def get_resample_labels(datetimes, num, session=None):
+    """
+    Labels of the minute resample buckets which bars of given datetimes fall in, buckets are closed
+    and labeled on the right, so the bar exactly at the label belongs to the bucket.
+
+    Parameters
+    ----------
+    datetimes: numpy.ndarray
+        Datetimes of bars in YYYYMMDDHHMMSS format.
+    num: int
+        Minutes of a bucket.
+    session: rqalpha_mod_fxdayu_source.share.trading_session.TradingSession
+        Trading session to align buckets with, buckets start from the midnight if it's None.
+
+    Returns
+    -------
+    numpy.ndarray: Comparable labels of int64.
+    """
+    datetimes = datetimes.astype(np.int64)
+    minutes = datetimes // 10000 % 100 * 60 + datetimes // 100 % 100
+    if session is not None:
+        labels = get_session_bucket_table(session, num)[minutes]
+    else:
+        labels = -(-minutes // num) * num
+    # leave room for labels exceed the midnight
+    return datetimes // 1000000 * 2880 + labels
+
+
+def get_day_labels(datetimes, num, trading_dates):
+    """
+    Labels of the buckets of num trading days which daily bars of given datetimes fall in, counted
+    by the positions in the trading calendar.
+
+    Parameters
+    ----------
+    datetimes: numpy.ndarray
+        Datetimes of bars in YYYYMMDDHHMMSS format.
+    num: int
+        Trading days of a bucket.
+    trading_dates: numpy.ndarray
+        Sorted trading dates in YYYYMMDD format.
+
+    Returns
+    -------
+    numpy.ndarray: Comparable labels of int64.
+    """
+    return trading_dates.searchsorted(datetimes.astype(np.int64) // 1000000) // num
+
+
+def get_week_labels(datetimes, num):
+    """
+    Labels of the buckets of num weeks starting on monday which bars of given datetimes fall in.
+
+    Returns
+    -------
+    numpy.ndarray: Comparable labels of int64.
+    """
+    dates = datetimes.astype(np.int64) // 1000000
+    days = (dates // 10000 - 1970).astype("datetime64[Y]").astype("datetime64[M]") + (dates // 100 % 100 - 1)
+    days = days.astype("datetime64[D]") + (dates % 100 - 1)
+    # 1970-01-01 is thursday
+    return (days.astype(np.int64) + 3) // 7 // num
+
+
+def resample_bars(bars, frequency, session=None):
+    """
+    Resample minute bars into a lower frequency like "5m" or "1h" directly on the structured array.
+
+    Buckets are aligned with the trading session if given, otherwise start from the midnight of every day,
+    closed and labeled on the right as ``DataFrame.resample(closed="right", label="right")`` does.
+    The datetime of a resampled bar is the datetime of the last bar in its bucket.
+
+    Parameters
+    ----------
+    bars: numpy.ndarray
+        Minute bars sorted by datetime.
+    frequency: str
+        Frequency to resample into, "m" or "h".
+    session: rqalpha_mod_fxdayu_source.share.trading_session.TradingSession
+        Trading session of the instrument.
+
+    Returns
+    -------
+    numpy.ndarray: Resampled bars of fields datetime, open, high, low, close and volume.
+    """
+    labels = get_resample_labels(bars["datetime"], get_frequency_minutes(frequency), session)
+    return resample_bars_by_labels(bars, labels)
+
+
+def resample_bars_by_labels(bars, labels):
+    """
+    Resample bars sorted by datetime into buckets of the same label.
+
+    Parameters
+    ----------
+    bars: numpy.ndarray
+        Bars sorted by datetime.
+    labels: numpy.ndarray
+        Sorted labels of bars.
+
+    Returns
+    -------
+    numpy.ndarray: Resampled bars of fields datetime, open, high, low, close and volume.
+    """
+    dtype = [(f, StockBarConverter.field_type(f, bars.dtype[f])) if f != "datetime" else ("datetime", np.uint64)
+             for f in RESAMPLE_FIELDS]
+    if not len(bars):
+        return np.empty((0,), dtype=dtype)
+    starts = np.flatnonzero(np.concatenate([[True], labels[1:] != labels[:-1]]))
+    ends = np.append(starts[1:], len(bars)) - 1
+    result = np.empty((len(starts),), dtype=dtype)
+    result["datetime"] = bars["datetime"][ends]
+    result["open"] = bars["open"][starts]
+    # skip nan like pandas does
+    result["high"] = np.fmax.reduceat(bars["high"], starts)
+    result["low"] = np.fmin.reduceat(bars["low"], starts)
+    result["close"] = bars["close"][ends]
+    result["volume"] = np.add.reduceat(bars["volume"], starts)
+    return result
+
+
+def fill_suspended_bars(bars, labels, grid_labels, grid_datetimes):
+    """
+    Align resampled bars with a grid of buckets, buckets without bar are filled with the close of the last bar
+    before them and volume 0 as suspended bars. Buckets before the first bar are dropped.
+
+    Parameters
+    ----------
+    bars: numpy.ndarray
+        Resampled bars sorted by datetime.
+    labels: numpy.ndarray
+        Sorted labels of bars.
+    grid_labels: numpy.ndarray
+        Sorted labels of all buckets.
+    grid_datetimes: numpy.ndarray
+        Datetimes of the suspended bars of every bucket.
+
+    Returns
+    -------
+    numpy.ndarray: Bars of every bucket from the first bar on.
+    """
+    pos = grid_labels.searchsorted(labels)
+    matched = pos < len(grid_labels)
+    matched[matched] = grid_labels[pos[matched]] == labels[matched]
+    source = np.full((len(grid_labels),), -1, dtype=np.int64)
+    source[pos[matched]] = np.flatnonzero(matched)
+    suspended = source < 0
+    # position of the last bar at or before every bucket
+    source = np.maximum.accumulate(source)
+    started = source >= 0
+    source, suspended = source[started], suspended[started]
+    result = bars[source]
+    result["datetime"][suspended] = grid_datetimes[started][suspended]
+    close = result["close"][suspended]
+    for field in ("open", "high", "low"):
+        result[field][suspended] = close
+    result["volume"][suspended] = 0
+    return result
@@ -0,0 +1,133 @@
+# encoding: utf-8
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+import pandas as pd
+from rqalpha.utils.datetime_func import convert_dt_to_int
+
+from rqalpha_mod_fxdayu_source.data_source.common import CacheMixin
+from rqalpha_mod_fxdayu_source.data_source.common.odd import OddFrequencyDataSource
+
+FIELDS = ["open", "high", "low", "close", "volume"]
+DAYS = [date(2018, 1, 2), date(2018, 1, 3), date(2018, 1, 4), date(2018, 1, 5)]
+CODES = ["000001.XSHE", "000002.XSHE", "600000.XSHG"]
+
+
+class MemoryInstrument(object):
+    def __init__(self, order_book_id, type_="CS"):
+        self.order_book_id = order_book_id
+        self.type = type_
+        self.enum_type = type_
+
+    def __repr__(self):
+        return "MemoryInstrument(%s)" % self.order_book_id
+
+
+def make_bars(datetimes, seed=0, fields=FIELDS):
+    """
+    Random bars of given datetimes.
+    """
+    rng = np.random.RandomState(seed)
+    bars = np.empty((len(datetimes),), dtype=[("datetime", np.uint64)] + [(f, np.float64) for f in fields])
+    bars["datetime"] = [convert_dt_to_int(dt) for dt in datetimes]
+    for field in fields:
+        bars[field] = rng.rand(len(datetimes)) + 10
+    if "high" in fields and "low" in fields:
+        bars["high"] += 1
+        bars["low"] -= 1
+    return bars
+
+
+def make_ex_factors(*factors):
+    """
+    Ex cum factors starting from 1.0, factors are given as (start_date, ex_cum_factor).
+    """
+    return np.array([(0, 1.0)] + list(factors), dtype=[("start_date", np.uint64), ("ex_cum_factor", np.float64)])
+
+
+def minutes_of(start, count):
+    return [start + timedelta(minutes=n) for n in range(count)]
+
+
+def session_minutes(days):
+    """
+    Minutes of the A share trading session in given days.
+    """
+    minutes = []
+    for day in days:
+        for start, end in ((time(9, 31), time(11, 30)), (time(13, 1), time(15, 0))):
+            dt = datetime.combine(day, start)
+            while dt.time() <= end:
+                minutes.append(dt)
+                dt += timedelta(minutes=1)
+    return minutes
+
+
+def select(bars, fields):
+    if fields is None:
+        return bars.copy()
+    names = ["datetime"] + list(fields)
+    result = np.empty(bars.shape, dtype=[(name, bars.dtype[name]) for name in names])
+    for name in names:
+        result[name] = bars[name]
+    return result
+
+
+class MemoryBarsSource(object):
+    """
+    Backend of bars held in memory, calls of raw_history_bars are recorded.
+    """
+
+    def __init__(self, bars):
+        self.bars = bars
+        self.calls = []
+
+    def raw_history_bars(self, instrument, frequency, start_dt=None, end_dt=None, length=None, fields=None):
+        self.calls.append((instrument.order_book_id, frequency, start_dt, end_dt, length, fields))
+        bars = self.bars.get((instrument.order_book_id, frequency))
+        if bars is None:
+            return None
+        datetimes = bars["datetime"]
+        if start_dt and end_dt:
+            s = datetimes.searchsorted(np.uint64(convert_dt_to_int(start_dt)))
+            e = datetimes.searchsorted(np.uint64(convert_dt_to_int(end_dt)), side="right")
+        elif end_dt:
+            e = datetimes.searchsorted(np.uint64(convert_dt_to_int(end_dt)), side="right")
+            s = max(e - length, 0)
+        else:
+            s = datetimes.searchsorted(np.uint64(convert_dt_to_int(start_dt)))
+            e = s + length
+        return select(bars[s:e], fields)
+
+    def is_base_frequency(self, instrument, frequency):
+        return (instrument.order_book_id, frequency) in self.bars
+
+
+class MemoryCacheSource(MemoryBarsSource, CacheMixin):
+    def __init__(self, bars):
+        MemoryBarsSource.__init__(self, bars)
+        CacheMixin.__init__(self)
+
+
+class MemoryOddSource(OddFrequencyDataSource):
+    """
+    OddFrequencyDataSource over bars held in memory.
+    """
+
+    def __init__(self, bars, days, ex_factors=None):
+        super(MemoryOddSource, self).__init__()
+        self.memory = MemoryBarsSource(bars)
+        self.days = days
+        self.ex_factors = ex_factors or {}
+
+    def raw_history_bars(self, *args, **kwargs):
+        return self.memory.raw_history_bars(*args, **kwargs)
+
+    def is_base_frequency(self, instrument, frequency):
+        return self.memory.is_base_frequency(instrument, frequency)
+
+    def get_ex_cum_factor(self, order_book_id):
+        return self.ex_factors.get(order_book_id)
+
+    def get_trading_calendar(self):
+        return pd.DatetimeIndex(self.days)
@@ -0,0 +1,132 @@
+# encoding: utf-8
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pandas as pd
+from pymongo.mongo_client import database
+
+from rqalpha_mod_fxdayu_source.share.mongo_handler import MongoHandler
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+class TestMongoHandler(unittest.TestCase):
+    def setUp(self):
+        self.handler = MongoHandler(batch_size=4)
+        self.handler.client = mock.MagicMock()
+        self.collection = mock.MagicMock(spec=database.Collection)
+        self.collection.name = "000001.XSHE"
+        index = pd.DatetimeIndex([datetime(2018, 1, 2, 15) + timedelta(days=i) for i in range(10)], name="datetime")
+        self.df = pd.DataFrame({"close": [float(i) for i in range(10)], "volume": list(range(10))}, index=index)
+
+    def requests(self):
+        return [request for call in self.collection.bulk_write.call_args_list for request in call[0][0]]
+
+    def test_normalize(self):
+        docs = self.handler.normalize(self.df, "datetime")
+        self.assertEqual(len(docs), 10)
+        self.assertEqual(docs[1], {"close": 1.0, "volume": 1, "datetime": datetime(2018, 1, 3, 15)})
+        self.assertIs(type(docs[1]["volume"]), int)
+        self.assertEqual(self.handler.normalize({"a": [1, 2], "b": [3, 4]}), [{"a": 1, "b": 3}, {"a": 2, "b": 4}])
+
+    def test_write(self):
+        self.handler.write(self.df, self.collection, index="datetime")
+        self.assertEqual(self.collection.bulk_write.call_count, 3)
+        self.assertFalse(self.collection.bulk_write.call_args[1]["ordered"])
+        self.assertEqual(len(self.requests()), 10)
+
+    def test_inplace(self):
+        self.handler.inplace(self.df, self.collection)
+        self.assertFalse(self.collection.bulk_write.call_args[1]["ordered"])
+        self.assertEqual(len(self.requests()), 10)
+        self.collection.insert_many.assert_not_called()
+        filters = self.collection.delete_many.call_args[0][0]["datetime"]
+        self.assertEqual(filters["$gte"], datetime(2018, 1, 2, 15))
+        self.assertEqual(filters["$lte"], datetime(2018, 1, 11, 15))
+        self.assertEqual(len(filters["$nin"]), 10)
+
+    def test_update(self):
+        self.handler.update(self.df[["close"]], self.collection)
+        self.assertFalse(self.collection.bulk_write.call_args[1]["ordered"])
+        self.assertEqual(self.collection.bulk_write.call_count, 3)
+        self.collection.update_one.assert_not_called()
+
+    def test_extend_date_range(self):
+        client = self.handler.client
+        self.collection.database.name = "stock_d"
+        self.handler.write(self.df, self.collection, index="datetime")
+        meta = client[MongoHandler.META_DB][MongoHandler.DATE_RANGE_COLLECTION]
+        filters, update = meta.update_one.call_args[0]
+        self.assertEqual(filters, {"db": "stock_d", "index": "datetime"})
+        self.assertEqual(update, {"$min": {"start": datetime(2018, 1, 2, 15)},
+                                  "$max": {"end": datetime(2018, 1, 11, 15)}})
+        self.assertNotIn("upsert", meta.update_one.call_args[1])
+
+
+@unittest.skipIf(mongomock is None, "mongomock is not installed")
+class TestMongoHandlerOnMongomock(unittest.TestCase):
+    def setUp(self):
+        self.handler = MongoHandler(batch_size=4)
+        self.handler.client = mongomock.MongoClient()
+        self.collection = self.handler.client["stock_d"]["000001.XSHE"]
+
+    def frame(self, days, close):
+        index = pd.DatetimeIndex([datetime(2018, 1, 2, 15) + timedelta(days=d) for d in days], name="datetime")
+        return pd.DataFrame({"close": close, "volume": [1] * len(days)}, index=index)
+
+    def read(self):
+        return list(self.collection.find({}, {"_id": 0}).sort("datetime", 1))
+
+    def test_inplace(self):
+        self.handler.inplace(self.frame(range(10), [float(d) for d in range(10)]), "000001.XSHE", db="stock_d")
+        self.assertEqual(len(self.read()), 10)
+        # the days missing between 2018-01-04 and 2018-01-14 are deleted, 2018-01-06 is changed
+        self.handler.inplace(self.frame([2, 4, 6, 12], [2.0, 40.0, 6.0, 12.0]), "000001.XSHE", db="stock_d")
+        docs = self.read()
+        self.assertEqual([doc["datetime"].day for doc in docs], [2, 3, 4, 6, 8, 14])
+        self.assertEqual([doc["close"] for doc in docs], [0.0, 1.0, 2.0, 40.0, 6.0, 12.0])
+        # replaced as a whole rather than inserted again
+        self.assertEqual(set(docs[3]), {"datetime", "close", "volume"})
+        self.assertEqual(self.collection.count_documents({"datetime": datetime(2018, 1, 6, 15)}), 1)
+        # the index created by the handler is not unique, upserts must not duplicate the keys
+        self.assertEqual(len(set(doc["datetime"] for doc in docs)), len(docs))
+
+    def insert(self, name, days):
+        self.handler.client["stock_d"][name].insert_many(
+            [{"datetime": datetime(2018, 1, 2, 15) + timedelta(days=d), "close": 1.0} for d in days]
+        )
+
+    def test_date_range(self):
+        self.assertIsNone(self.handler.get_date_range("stock_d"))
+        for n in range(30):
+            self.insert("%06d.XSHE" % n, range(n, n + 10))
+        start, end = datetime(2018, 1, 2, 15), datetime(2018, 2, 9, 15)
+        self.assertEqual(self.handler.get_date_range("stock_d"), (start, end))
+        meta = self.handler.client[MongoHandler.META_DB][MongoHandler.DATE_RANGE_COLLECTION]
+        self.assertEqual(meta.find_one({"db": "stock_d"}, {"_id": 0}),
+                         {"db": "stock_d", "index": "datetime", "start": start, "end": end})
+
+    def test_date_range_refreshed(self):
+        self.insert("000001.XSHE", range(10))
+        self.assertEqual(self.handler.get_date_range("stock_d"),
+                         (datetime(2018, 1, 2, 15), datetime(2018, 1, 11, 15)))
+        # written without the handler, the stored record is returned until refreshed
+        self.insert("000002.XSHE", [-5, 3])
+        self.insert("600000.XSHG", [20])
+        self.assertEqual(self.handler.get_date_range("stock_d"),
+                         (datetime(2018, 1, 2, 15), datetime(2018, 1, 11, 15)))
+        expected = (datetime(2017, 12, 28, 15), datetime(2018, 1, 22, 15))
+        self.assertEqual(self.handler.refresh_date_range("stock_d"), expected)
+        self.assertEqual(self.handler.get_date_range("stock_d"), expected)
+        # written by the handler, the stored record is extended
+        self.handler.write([{"datetime": datetime(2018, 2, 1, 15), "close": 1.0}], "000001.XSHE", db="stock_d",
+                           index="datetime")
+        self.assertEqual(self.handler.get_date_range("stock_d"), (expected[0], datetime(2018, 2, 1, 15)))
+
+
+if __name__ == '__main__':
+    unittest.main()
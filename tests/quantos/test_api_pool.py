@@ -0,0 +1,75 @@
+# encoding: utf-8
+import threading
+import time
+import unittest
+from unittest import mock
+
+import asyncio
+import pandas as pd
+from rqalpha.const import INSTRUMENT_TYPE
+
+from rqalpha_mod_fxdayu_source.data_source import quantos
+from rqalpha_mod_fxdayu_source.data_source.quantos import QuantOsSource
+from tests.common.memory import MemoryInstrument
+
+
+class FakeApi(object):
+    lock = threading.Lock()
+    running = 0
+    max_running = 0
+
+    def __init__(self):
+        self.busy = False
+
+    def bar(self, symbol, freq, trade_date, start_time, end_time, fields):
+        assert not self.busy, "DataApi used by two threads at once"
+        self.busy = True
+        with FakeApi.lock:
+            FakeApi.running += 1
+            FakeApi.max_running = max(FakeApi.max_running, FakeApi.running)
+        time.sleep(0.05)
+        with FakeApi.lock:
+            FakeApi.running -= 1
+        self.busy = False
+        return pd.DataFrame({"trade_date": [trade_date], "time": [end_time]}), "0,"
+
+
+class TestBarApiPool(unittest.TestCase):
+    def setUp(self):
+        FakeApi.running = FakeApi.max_running = 0
+        self.source = QuantOsSource.__new__(QuantOsSource)
+        self.source._api_lock = threading.RLock()
+        self.source._bar_apis = quantos.queue.Queue()
+        self.source._bar_api_count = 0
+        self.instrument = MemoryInstrument("000001.XSHE")
+        self.instrument.enum_type = INSTRUMENT_TYPE.CS
+
+    def query(self, days):
+        async def gather():
+            return await asyncio.gather(*[
+                self.source._get_bars_in_day(self.instrument, "1m", day * 1000000, 93100, 150000) for day in days
+            ])
+
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(gather())
+        finally:
+            loop.close()
+
+    def test_concurrent(self):
+        days = list(range(20180102, 20180110))
+        with mock.patch.object(quantos, "new_api", side_effect=FakeApi) as new_api, \
+                mock.patch.object(QuantOsSource, "MAX_CONCURRENT_REQUESTS", 4):
+            results = self.query(days)
+            self.assertEqual([df["trade_date"][0] for df, msg in results], days)
+            self.assertGreater(FakeApi.max_running, 1)
+            self.assertLessEqual(FakeApi.max_running, 4)
+            self.assertLessEqual(new_api.call_count, 4)
+            # idle connections are reused
+            self.query(days)
+            self.assertEqual(new_api.call_count, self.source._bar_api_count)
+            self.assertLessEqual(new_api.call_count, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,25 @@
+# encoding: utf-8
+import asyncio
+import unittest
+
+from rqalpha_mod_fxdayu_source.utils.asyncio import bounded_gather, get_asyncio_event_loop
+
+
+class TestBoundedGather(unittest.TestCase):
+    def test_bounded_gather(self):
+        running = []
+        peak = []
+
+        async def job(n):
+            running.append(n)
+            peak.append(len(running))
+            await asyncio.sleep(0.001 * (n % 3))
+            running.remove(n)
+            return n * n
+
+        loop = get_asyncio_event_loop()
+        results = loop.run_until_complete(bounded_gather([job(n) for n in range(20)], 4))
+        self.assertEqual(results, [n * n for n in range(20)])
+        self.assertEqual(max(peak), 4)
+        results = loop.run_until_complete(bounded_gather([job(n) for n in range(20)]))
+        self.assertEqual(max(peak), 20)
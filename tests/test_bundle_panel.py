@@ -0,0 +1,61 @@
+# encoding: utf-8
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+from rqalpha_mod_fxdayu_source.data_source.bundle import BundleDataSource
+from tests.common.memory import FIELDS, MemoryInstrument, make_ex_factors
+
+
+class FakeMinuteReader(object):
+    """
+    Arrays as AStockBcolzMinuteBarReader reads them, prices of minutes without bars are nan and volumes 0.
+    """
+
+    def __init__(self, datetimes, arrays):
+        self.datetimes = datetimes
+        self.arrays = arrays
+
+    def load_raw_arrays_before(self, instruments, end_dt, length, fields=None):
+        return self.datetimes[-length:], [self.arrays[field][-length:].copy() for field in fields]
+
+
+class TestBundlePanel(unittest.TestCase):
+    def setUp(self):
+        self.instruments = [MemoryInstrument("000001.XSHE"), MemoryInstrument("000002.XSHE")]
+        datetimes = np.array([20180102093100 + 100 * n for n in range(10)], dtype=np.uint64)
+        rng = np.random.RandomState(0)
+        arrays = {field: rng.rand(10, 2) + 10 for field in FIELDS}
+        # 000002.XSHE has no bars in the last 4 minutes
+        for field in FIELDS:
+            arrays[field][6:, 1] = 0 if field == "volume" else np.nan
+        self.arrays = arrays
+        self.source = BundleDataSource.__new__(BundleDataSource)
+        self.source._bundle_reader = FakeMinuteReader(datetimes, arrays)
+        self.source.get_ex_cum_factor = lambda order_book_id: None
+
+    def test_missing_minutes(self):
+        panel = self.source.history_bars_panel(self.instruments, 8, "1m", None, datetime(2018, 1, 2, 9, 40),
+                                               adjust_type="none")
+        self.assertEqual(list(panel), ["datetime"] + FIELDS)
+        for field in FIELDS:
+            self.assertEqual(panel[field].shape, (8, 2))
+            self.assertTrue(np.isnan(panel[field][4:, 1]).all())
+            np.testing.assert_array_equal(panel[field][:4, 1], self.arrays[field][2:6, 1])
+            np.testing.assert_array_equal(panel[field][:, 0], self.arrays[field][2:, 0])
+
+    def test_adjust(self):
+        ex_factors = make_ex_factors((20180102093500, 2.0))
+        self.source.get_ex_cum_factor = lambda order_book_id: ex_factors
+        panel = self.source.history_bars_panel(self.instruments, 10, "1m", ["close", "volume"],
+                                               datetime(2018, 1, 2, 9, 40), adjust_type="pre",
+                                               adjust_orig=datetime(2018, 1, 3))
+        np.testing.assert_allclose(panel["close"][:4, 0], self.arrays["close"][:4, 0] / 2)
+        np.testing.assert_allclose(panel["volume"][:4, 0], self.arrays["volume"][:4, 0] * 2)
+        np.testing.assert_allclose(panel["close"][4:, 0], self.arrays["close"][4:, 0])
+        self.assertTrue(np.isnan(panel["volume"][6:, 1]).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+# encoding: utf-8
+import unittest
+
+import numpy as np
+
+from rqalpha_mod_fxdayu_source.data_source.common.cache import BarsBuffer
+
+DTYPE = [("datetime", np.uint64), ("close", np.float64)]
+
+
+def make_bars(start, length):
+    bars = np.empty((length,), dtype=DTYPE)
+    bars["datetime"] = np.arange(start, start + length)
+    bars["close"] = np.arange(start, start + length)
+    return bars
+
+
+class TestBarsBuffer(unittest.TestCase):
+    def test_append(self):
+        buffer = BarsBuffer(10, 40)
+        assert buffer.append(make_bars(0, 5)) == 0
+        assert buffer.append(make_bars(5, 5)) == 0
+        assert len(buffer) == 10
+        assert (buffer.data["datetime"] == np.arange(10)).all()
+        assert buffer.append(make_bars(10, 5)) == 5
+        assert len(buffer) == 10
+        assert (buffer.data["datetime"] == np.arange(5, 15)).all()
+
+    def test_compact_keeps_old_views(self):
+        buffer = BarsBuffer(10, 20)
+        buffer.append(make_bars(0, 10))
+        old = buffer.data
+        raw = buffer._buffer
+        buffer.append(make_bars(10, 10))
+        assert buffer._buffer is raw
+        buffer.append(make_bars(20, 10))
+        assert buffer._buffer is not raw
+        assert (old["datetime"] == np.arange(10)).all()
+        assert (buffer.data["datetime"] == np.arange(20, 30)).all()
+        assert buffer.nbytes == buffer._buffer.nbytes == 20 * np.dtype(DTYPE).itemsize
+
+    def test_grow(self):
+        buffer = BarsBuffer(100)
+        buffer.append(make_bars(0, 3))
+        # the whole allocation is charged, the buffer grows with the rows held
+        assert len(buffer._buffer) == 6
+        assert buffer.nbytes == 6 * np.dtype(DTYPE).itemsize
+        for start in range(3, 300, 3):
+            buffer.append(make_bars(start, 3))
+            assert len(buffer._buffer) <= 150
+        assert len(buffer) == 100
+        assert buffer.nbytes == len(buffer._buffer) * np.dtype(DTYPE).itemsize
+        assert buffer.nbytes <= 150 * np.dtype(DTYPE).itemsize
+        assert (buffer.data["datetime"] == np.arange(200, 300)).all()
+
+    def test_prepend(self):
+        buffer = BarsBuffer(10, 20)
+        buffer.append(make_bars(10, 10))
+        buffer.prepend(make_bars(0, 10))
+        assert len(buffer) == 20
+        assert (buffer.data["datetime"] == np.arange(20)).all()
+        buffer.append(make_bars(20, 5))
+        assert len(buffer) == 20
+        assert (buffer.data["datetime"] == np.arange(5, 25)).all()
+
+    def test_attach_read_only(self):
+        buffer = BarsBuffer(10, 20)
+        shared = make_bars(0, 10)
+        shared.flags.writeable = False
+        buffer.attach(shared)
+        assert buffer.data.base is shared or buffer.data is shared
+        buffer.append(make_bars(10, 5))
+        assert (buffer.data["datetime"] == np.arange(5, 15)).all()
+        assert (shared["datetime"] == np.arange(10)).all()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+# encoding: utf-8
+import unittest
+
+from rqalpha_mod_fxdayu_source.data_source.common.cache import CacheLRU
+
+
+class Sized(object):
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+
+def key(order_book_id):
+    return order_book_id, "1m"
+
+
+class TestCacheLRU(unittest.TestCase):
+    def setUp(self):
+        self.evicted = []
+        self.lru = CacheLRU(100, on_evict=self.evicted.append)
+
+    def test_space(self):
+        self.lru[key("a")] = Sized(30)
+        self.lru[key("b")] = Sized(40)
+        self.assertEqual(self.lru.space, 70)
+        self.lru[key("a")] = Sized(10)
+        self.assertEqual(self.lru.space, 50)
+        del self.lru[key("b")]
+        self.assertEqual(self.lru.space, 10)
+        self.assertEqual(self.evicted, [])
+
+    def test_evict_least_recently_used(self):
+        for name in "abc":
+            self.lru[key(name)] = Sized(30)
+        self.lru[key("a")]  # touch
+        self.lru[key("d")] = Sized(30)
+        self.assertNotIn(key("b"), self.lru)
+        self.assertEqual(self.evicted, [key("b")])
+        self.assertEqual(self.lru.space, 90)
+
+    def test_resize_oldest(self):
+        for name in "abc":
+            self.lru[key(name)] = Sized(30)
+        # the oldest entry grows, the others are evicted until the budget is met again
+        self.lru._items[key("a")].nbytes = 80
+        self.lru.resize(key("a"))
+        self.assertEqual(self.evicted, [key("b"), key("c")])
+        self.assertIn(key("a"), self.lru)
+        self.assertEqual(self.lru.space, 80)
+
+    def test_single_oversized(self):
+        self.lru[key("a")] = Sized(30)
+        self.lru[key("b")] = Sized(150)
+        self.assertEqual(self.evicted, [key("a")])
+        self.assertIn(key("b"), self.lru)
+        self.assertEqual(self.lru.space, 150)
+
+
+if __name__ == '__main__':
+    unittest.main()
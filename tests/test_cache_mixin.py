@@ -0,0 +1,132 @@
+# encoding: utf-8
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import numpy as np
+from rqalpha.utils.datetime_func import convert_dt_to_int
+
+from rqalpha_mod_fxdayu_source.data_source.common import CacheMixin
+from rqalpha_mod_fxdayu_source.data_source.common import cache as cache_module
+from tests.common.memory import MemoryCacheSource, MemoryInstrument, make_bars, minutes_of
+
+START = datetime(2018, 1, 2, 9, 31)
+MINUTES = minutes_of(START, 250)
+
+
+class TestCacheMixin(unittest.TestCase):
+    def setUp(self):
+        self._cache_length = CacheMixin.CACHE_LENGTH
+        CacheMixin.set_cache_length(20)
+        self.instrument = MemoryInstrument("000001.XSHE")
+        self.bars = make_bars(MINUTES)
+        self.source = MemoryCacheSource({("000001.XSHE", "1m"): self.bars})
+
+    def tearDown(self):
+        CacheMixin.set_cache_length(self._cache_length)
+
+    def history(self, end, length, fields=None):
+        return self.source.raw_history_bars(self.instrument, "1m", end_dt=MINUTES[end], length=length, fields=fields)
+
+    def expected(self, end, length):
+        return self.bars[max(end + 1 - length, 0):end + 1]
+
+    def test_lookback_after_sliding(self):
+        # reaches the first bar of the backend
+        np.testing.assert_array_equal(self.history(30, 50), self.expected(30, 50))
+        # the cache rolls forward and its head slides out
+        for end in range(31, 200):
+            np.testing.assert_array_equal(self.history(end, 10), self.expected(end, 10))
+        np.testing.assert_array_equal(self.history(199, 150), self.expected(199, 150))
+
+    def test_projection_from_wider_cache(self):
+        self.source.warmup_cache([self.instrument], "1m", MINUTES[100])
+        calls = len(self.source.calls)
+        bars = self.history(110, 15, fields=["close", "volume"])
+        self.assertEqual(len(self.source.calls), calls)
+        self.assertEqual(bars.dtype.names, ("datetime", "close", "volume"))
+        expected = self.expected(110, 15)
+        for field in bars.dtype.names:
+            np.testing.assert_array_equal(bars[field], expected[field])
+
+    def test_fields_widened(self):
+        self.history(100, 15, fields=["close"])
+        self.history(100, 15, fields=["open", "close"])
+        cache = self.source._caches[("000001.XSHE", "1m")]
+        self.assertEqual(cache.fields, ("close", "open"))
+        calls = len(self.source.calls)
+        bars = self.history(105, 15, fields=["open"])
+        self.assertEqual(len(self.source.calls), calls)
+        np.testing.assert_array_equal(bars["open"], self.expected(105, 15)["open"])
+
+    def test_warmup_keeps_fields(self):
+        self.history(100, 15, fields=["close"])
+        calls = len(self.source.calls)
+        self.source.warmup_cache([self.instrument], "1m", MINUTES[130])
+        self.assertGreater(len(self.source.calls), calls)
+        for call in self.source.calls[calls:]:
+            self.assertEqual(list(call[-1]), ["close"])
+        cache = self.source._caches[("000001.XSHE", "1m")]
+        self.assertEqual(cache.fields, ("close",))
+        calls = len(self.source.calls)
+        bars = self.history(135, 10, fields=["close"])
+        self.assertEqual(len(self.source.calls), calls)
+        np.testing.assert_array_equal(bars["close"], self.expected(135, 10)["close"])
+
+    def test_extend_from_between_bars(self):
+        self.history(150, 10)
+        cache = self.source._caches[("000001.XSHE", "1m")]
+        first = list(MINUTES).index(cache.first_dt)
+        self.assertGreater(first, 10)
+        end_dt = MINUTES[first + 5]
+        # a datetime between two bars and one before the first bar of the backend
+        for start_dt in (MINUTES[first - 10] + timedelta(seconds=30), START - timedelta(days=1)):
+            expected = self.bars[self.bars["datetime"] >= np.uint64(convert_dt_to_int(start_dt))]
+            expected = expected[expected["datetime"] <= np.uint64(convert_dt_to_int(end_dt))]
+            calls = len(self.source.calls)
+            for _ in range(3):
+                bars = self.source.raw_history_bars(self.instrument, "1m", start_dt=start_dt, end_dt=end_dt)
+                np.testing.assert_array_equal(bars, expected)
+            # extended once, then served from memory
+            self.assertEqual(len(self.source.calls), calls + 1)
+
+    def test_read_ahead(self):
+        CacheMixin.set_prefetch_threshold(0.5)
+        try:
+            for thread_safe in (False, True):
+                self.source.THREAD_SAFE = thread_safe
+                self.source.clear_cache()
+                for end in range(30, 200):
+                    np.testing.assert_array_equal(self.history(end, 10), self.expected(end, 10))
+                # the backend is only read in background if it is thread safe
+                self.assertEqual(self.source._executor is not None, thread_safe)
+                self.source.stop_read_ahead()
+        finally:
+            CacheMixin.set_prefetch_threshold(None)
+
+    def test_shared_cache_evicted(self):
+        root = tempfile.mkdtemp()
+        CacheMixin.set_shared_cache(True)
+        try:
+            with mock.patch.object(cache_module, "get_shared_memory_dir", return_value=root):
+                source = MemoryCacheSource({("000001.XSHE", "1m"): self.bars, ("000002.XSHE", "1m"): self.bars})
+            source.raw_history_bars(self.instrument, "1m", end_dt=MINUTES[100], length=10)
+            store = source._shared_store
+            self.assertGreater(store.space, 0)
+            # evicted with the cache
+            source._caches._max_space = 0
+            source.raw_history_bars(MemoryInstrument("000002.XSHE"), "1m", end_dt=MINUTES[100], length=10)
+            self.assertNotIn(("000001.XSHE", "1m"), set(key for key, nbytes in store._files.values()))
+            source.release_shared_cache()
+            self.assertEqual(store.space, 0)
+            self.assertEqual([files for _, _, files in os.walk(root) if files], [])
+        finally:
+            CacheMixin.set_shared_cache(False)
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+# encoding: utf-8
+import json
+import os
+import tempfile
+import unittest
+
+from rqalpha_mod_fxdayu_source.data_source.common.stats import CacheStats
+
+
+class TestCacheStats(unittest.TestCase):
+    def test_report(self):
+        stats = CacheStats("BundleCacheDataSource")
+        stats.incr("1m", "hits", 3)
+        stats.incr("1m", "misses")
+        stats.add_fetch_latency("1m", 0.02)
+        report = stats.report()
+        self.assertEqual(report["backend"], "BundleCacheDataSource")
+        item = report["frequencies"]["1m"]
+        self.assertEqual(item["hits"], 3)
+        self.assertEqual(item["hit_rate"], 0.75)
+        self.assertEqual(item["fetch_latency"]["count"], 1)
+        self.assertEqual(item["fetch_latency"]["buckets"]["<=0.05s"], 1)
+
+    def test_dump(self):
+        stats = CacheStats("MongoCacheDataSource")
+        stats.incr("1d", "evictions")
+        fd, path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            stats.dump(path)
+            with open(path) as f:
+                self.assertEqual(json.load(f)["frequencies"]["1d"]["evictions"], 1)
+        finally:
+            os.remove(path)
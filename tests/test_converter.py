@@ -0,0 +1,49 @@
+# encoding: utf-8
+import unittest
+from datetime import datetime, timedelta
+
+import numpy as np
+from rqalpha.utils.datetime_func import convert_dt_to_int
+
+from rqalpha_mod_fxdayu_source.utils.converter import MongoConverter, convert_datetime64_to_int
+
+
+def make_doc(start, length):
+    dts = [start + timedelta(minutes=i) for i in range(length)]
+    return {"_l": length, "datetime": dts, "open": [1.0] * length, "high": [2.0] * length, "low": [0.5] * length,
+            "close": [1.5] * length, "volume": list(range(length))}
+
+
+class TestMongoConverter(unittest.TestCase):
+    def test_convert_datetime64_to_int(self):
+        dts = [datetime(1999, 12, 31, 23, 59, 59), datetime(2024, 2, 29, 9, 31), datetime(2018, 1, 2, 15, 0, 1)]
+        result = convert_datetime64_to_int(np.array(dts, dtype="datetime64[us]"))
+        self.assertEqual(result.dtype, np.uint64)
+        self.assertEqual(result.tolist(), [convert_dt_to_int(dt) for dt in dts])
+
+    def test_docs2np(self):
+        first = make_doc(datetime(2018, 1, 2, 9, 31), 120)
+        second = make_doc(datetime(2018, 1, 3, 9, 31), 120)
+        del second["volume"]
+        bars = MongoConverter.docs2np([second, first])
+        self.assertEqual(len(bars), 240)
+        self.assertTrue((np.diff(bars["datetime"].astype(np.int64)) > 0).all())
+        self.assertEqual(bars["datetime"][0], 20180102093100)
+        np.testing.assert_array_equal(bars["volume"][:120], np.arange(120))
+        self.assertTrue(np.isnan(bars["volume"][120:]).all())
+        bars = MongoConverter.docs2np([first], ["datetime", "close"])
+        self.assertEqual(bars.dtype.names, ("datetime", "close"))
+
+    def test_rows2np(self):
+        docs = [{"datetime": datetime(2018, 1, 2, 15), "open": 1.0, "close": 2.0, "volume": 100.0},
+                {"datetime": datetime(2018, 1, 3, 15), "open": 2.0, "close": None}]
+        bars = MongoConverter.rows2np(docs, ["datetime", "close", "volume"])
+        self.assertEqual(bars["datetime"].tolist(), [20180102150000, 20180103150000])
+        self.assertEqual(bars["close"][0], 2.0)
+        self.assertTrue(np.isnan(bars["close"][1]))
+        self.assertTrue(np.isnan(bars["volume"][1]))
+        self.assertEqual(len(MongoConverter.rows2np([])), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+# encoding: utf-8
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+from rqalpha_mod_fxdayu_source.data_source.common.store import DiskBarsStore, SharedBarsStore
+
+
+class TestDiskBarsStore(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = DiskBarsStore(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_save_and_load(self):
+        bars = np.zeros((10,), dtype=[("datetime", np.uint64), ("close", np.float64)])
+        bars["datetime"] = np.arange(10)
+        dt = datetime(2018, 1, 2, 9, 31)
+        assert self.store.load("000001.XSHE", "1m", start_dt=dt, length=10) is None
+        self.store.save(bars, "000001.XSHE", "1m", start_dt=dt, length=10)
+        loaded = self.store.load("000001.XSHE", "1m", start_dt=dt, length=10)
+        assert isinstance(loaded, np.memmap)
+        assert (loaded == bars).all()
+        assert self.store.load("000001.XSHE", "1m", end_dt=dt, length=10) is None
+
+    def test_fields(self):
+        bars = np.zeros((10,), dtype=[("datetime", np.uint64), ("close", np.float64)])
+        dt = datetime(2018, 1, 2, 9, 31)
+        self.store.save(bars, "000001.XSHE", "1m", start_dt=dt, length=10, fields=["close"])
+        assert self.store.load("000001.XSHE", "1m", start_dt=dt, length=10) is None
+        loaded = self.store.load("000001.XSHE", "1m", start_dt=dt, length=10, fields=["close"])
+        assert loaded.dtype.names == ("datetime", "close")
+
+    def test_budget(self):
+        bars = np.zeros((100,), dtype=[("datetime", np.uint64), ("close", np.float64)])
+        dt = datetime(2018, 1, 2, 9, 31)
+        old = self.store.save(bars, "000001.XSHE", "1m", start_dt=dt, length=100)
+        size = os.path.getsize(old)
+        os.utime(old, (0, 0))
+        # files left by former runs are counted
+        store = DiskBarsStore(self.root, 3 * size + size // 2)
+        self.assertEqual(store.space, size)
+        paths = [store.save(bars, "00000%d.XSHE" % n, "1m", start_dt=dt, length=100) for n in range(2, 5)]
+        # the oldest files are deleted once over the budget
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+        self.assertLessEqual(store.space, 3 * size + size // 2)
+        self.assertEqual(DiskBarsStore(self.root, 2 * size).space, 2 * size)
+        self.assertFalse(os.path.exists(paths[0]))
+
+
+class TestSharedBarsStore(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.bars = np.zeros((100,), dtype=[("datetime", np.uint64), ("close", np.float64)])
+        self.dt = datetime(2018, 1, 2, 9, 31)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def save(self, store, order_book_id, length):
+        return store.save(self.bars, order_book_id, "1m", start_dt=self.dt, length=length)
+
+    def test_budget(self):
+        size = os.path.getsize(DiskBarsStore(self.root).save(self.bars, "000001.XSHE", "1d", length=100))
+        store = SharedBarsStore(self.root, 3 * size + size // 2)
+        paths = [self.save(store, "00000%d.XSHE" % n, 100) for n in range(5)]
+        # the oldest files are deleted once over the budget
+        self.assertEqual([os.path.exists(path) for path in paths], [False, False, True, True, True])
+        self.assertLessEqual(store.space, 3 * size + size // 2)
+
+    def test_remove_and_release(self):
+        store = SharedBarsStore(self.root, 1024 ** 2)
+        first = self.save(store, "000001.XSHE", 100)
+        second = self.save(store, "000001.XSHE", 200)
+        other = self.save(store, "000002.XSHE", 100)
+        store.remove("000001.XSHE", "1m")
+        self.assertFalse(os.path.exists(first) or os.path.exists(second))
+        self.assertTrue(os.path.exists(other))
+        # files saved by other processes are kept
+        foreign = DiskBarsStore(self.root).save(self.bars, "000003.XSHE", "1m", start_dt=self.dt, length=100)
+        store.release()
+        self.assertFalse(os.path.exists(other))
+        self.assertTrue(os.path.exists(foreign))
+        self.assertEqual(store.space, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
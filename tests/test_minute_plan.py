@@ -0,0 +1,186 @@
+# encoding: utf-8
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from datetime import date, datetime
+
+import numpy as np
+from rqalpha.const import INSTRUMENT_TYPE
+from rqalpha.utils.datetime_func import convert_dt_to_int
+
+from rqalpha_mod_fxdayu_source.data_source.common import CacheMixin
+from rqalpha_mod_fxdayu_source.data_source.common.minite import MiniteBarDataSourceMixin
+from tests.common.memory import MemoryInstrument, make_bars, session_minutes
+
+# 2018-01-06 and 2018-01-07 are weekend, 2018-01-10 is taken as a holiday
+DAYS = [date(2018, 1, d) for d in (2, 3, 4, 5, 8, 9, 11, 12)]
+BARS = make_bars(session_minutes(DAYS))
+DATES = np.array([convert_dt_to_int(datetime.combine(day, datetime.min.time())) for day in DAYS], dtype=np.int64)
+
+
+class MemoryMinuteSource(MiniteBarDataSourceMixin):
+    def __init__(self):
+        self.plans = []
+
+    def _dates_index(self, instrument, skip_suspend=True):
+        return DATES
+
+    async def _async_get_bars_in_days(self, instrument, frequency, plan, fields=None):
+        self.plans.append(plan)
+        bars = BARS[np.in1d(BARS["datetime"] // 1000000 * 1000000, plan.days)]
+        return bars[(bars["datetime"] >= plan.start) & (bars["datetime"] <= plan.end)]
+
+
+class MemoryMinuteCacheSource(MemoryMinuteSource, CacheMixin):
+    def __init__(self):
+        MemoryMinuteSource.__init__(self)
+        CacheMixin.__init__(self)
+
+    def is_base_frequency(self, instrument, frequency):
+        return frequency == "1m"
+
+
+class TestDaysPlan(unittest.TestCase):
+    def setUp(self):
+        self.source = MemoryMinuteSource()
+        self.instrument = MemoryInstrument("000001.XSHE")
+        self.instrument.enum_type = INSTRUMENT_TYPE.CS
+
+    def assert_bars(self, expected, **kwargs):
+        bars = self.source.raw_history_bars(self.instrument, "1m", **kwargs)
+        np.testing.assert_array_equal(bars, expected)
+
+    @staticmethod
+    def pos(dt, side="left"):
+        return BARS["datetime"].searchsorted(np.uint64(convert_dt_to_int(dt)), side=side)
+
+    def test_non_trading_end(self):
+        for end_dt in [datetime(2018, 1, 6, 10), datetime(2018, 1, 7, 15), datetime(2018, 1, 10, 9, 45)]:
+            for length in [1, 100, 240, 241, 700]:
+                e = self.pos(end_dt, "right")
+                self.assert_bars(BARS[max(e - length, 0):e], end_dt=end_dt, length=length)
+            # the bars of the last trading day before are planned
+            self.assertIn(DATES[DATES < convert_dt_to_int(end_dt)][-1], self.source.plans[-1].days)
+
+    def test_non_trading_start(self):
+        for start_dt in [datetime(2018, 1, 6, 10), datetime(2018, 1, 7, 15), datetime(2018, 1, 10, 9, 45)]:
+            for length in [1, 100, 240, 241, 700]:
+                s = self.pos(start_dt)
+                self.assert_bars(BARS[s:s + length], start_dt=start_dt, length=length)
+            self.assertIn(DATES[DATES > convert_dt_to_int(start_dt)][0], self.source.plans[-1].days)
+
+    def test_non_trading_range(self):
+        starts = [datetime(2018, 1, 6, 10), datetime(2018, 1, 10, 9, 45), datetime(2018, 1, 3, 13, 30)]
+        ends = [datetime(2018, 1, 7, 15), datetime(2018, 1, 10, 14), datetime(2018, 1, 13)]
+        for start_dt in starts:
+            for end_dt in ends:
+                if start_dt > end_dt:
+                    continue
+                self.assert_bars(BARS[self.pos(start_dt):self.pos(end_dt, "right")], start_dt=start_dt, end_dt=end_dt)
+        # nothing traded between
+        self.assert_bars(BARS[:0], start_dt=datetime(2018, 1, 6, 10), end_dt=datetime(2018, 1, 7, 15))
+        self.assert_bars(BARS[:0], start_dt=datetime(2018, 1, 10, 9), end_dt=datetime(2018, 1, 10, 15))
+
+    def test_batch(self):
+        instruments = [self.instrument, MemoryInstrument("000002.XSHE"), MemoryInstrument("600000.XSHG")]
+        for instrument in instruments:
+            instrument.enum_type = INSTRUMENT_TYPE.CS
+        requests = [
+            (instruments[0], "1m", dict(end_dt=datetime(2018, 1, 6, 10), length=300)),
+            (instruments[1], "1m", dict(start_dt=datetime(2018, 1, 3, 13, 30), length=500, fields=["close"])),
+            (instruments[2], "1m", dict(start_dt=datetime(2018, 1, 10, 9), end_dt=datetime(2018, 1, 12, 10))),
+            (instruments[0], "1d", dict(end_dt=datetime(2018, 1, 6, 10), length=3)),
+        ]
+        with mock.patch.object(MemoryMinuteSource, "MAX_CONCURRENT_REQUESTS", 2):
+            results = self.source.raw_history_bars_batch(requests)
+        self.assertEqual(set(results), set((i.order_book_id, f) for i, f, kwargs in requests))
+        for instrument, frequency, kwargs in requests:
+            expected = self.source.raw_history_bars(instrument, frequency, **kwargs)
+            bars = results[(instrument.order_book_id, frequency)]
+            if expected is None:
+                self.assertIsNone(bars)
+            else:
+                np.testing.assert_array_equal(bars, expected)
+
+    def test_cache_warmup(self):
+        source = MemoryMinuteCacheSource()
+        instruments = [self.instrument, MemoryInstrument("000002.XSHE")]
+        for instrument in instruments:
+            instrument.enum_type = INSTRUMENT_TYPE.CS
+        with mock.patch.object(source, "_gather_raw_history_bars",
+                               wraps=source._gather_raw_history_bars) as gather:
+            source.warmup_cache(instruments, "1m", datetime(2018, 1, 8, 9, 30))
+        # both directions of both instruments in one batch
+        self.assertEqual(gather.call_count, 1)
+        self.assertEqual(len(gather.call_args[0][0]), 4)
+        plans = len(source.plans)
+        end_dt = datetime(2018, 1, 8, 10)
+        for instrument in instruments:
+            np.testing.assert_array_equal(source.raw_history_bars(instrument, "1m", end_dt=end_dt, length=100),
+                                          BARS[self.pos(end_dt, "right") - 100:self.pos(end_dt, "right")])
+        self.assertEqual(len(source.plans), plans)
+
+
+class FakeTable(object):
+    def __init__(self, rootdir):
+        self.rootdir = rootdir
+
+
+class FakeDayBarStore(object):
+    def __init__(self, main, converter):
+        self._table = FakeTable(main)
+        self._converter = converter
+
+
+class TestCheckBundle(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.chunk = os.path.join(self.root, "stocks.bcolz", "close", "data", "__0.blp")
+        os.makedirs(os.path.dirname(self.chunk))
+        with open(self.chunk, "wb") as f:
+            f.write(b"0")
+        self.source = MemoryMinuteSource()
+        self.source._bundle_path = self.root
+        self.source._bundle_lock = threading.RLock()
+        self.source._day_bars = [FakeDayBarStore(os.path.join(self.root, "stocks.bcolz"), "converter")]
+        self.source._dates_indexes = {("000001.XSHE", True): DATES}
+        self.source._bundle_mtime = self.source._get_bundle_mtime()
+        self.source._bundle_checked = 0
+        self.source.DATES_INDEX_CHECK_INTERVAL = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_unchanged(self):
+        store = self.source._day_bars[0]
+        self.source._check_bundle()
+        self.assertIs(self.source._day_bars[0], store)
+        self.assertEqual(len(self.source._dates_indexes), 1)
+
+    def test_table_rewritten(self):
+        store = self.source._day_bars[0]
+        # a chunk rewritten in place, the directories keep their mtime
+        mtime = os.stat(self.root).st_mtime
+        later = time.time() + 10
+        os.utime(self.chunk, (later, later))
+        self.assertEqual(os.stat(self.root).st_mtime, mtime)
+        self.source._check_bundle()
+        self.assertIsNot(self.source._day_bars[0], store)
+        self.assertEqual(self.source._day_bars[0]._table.rootdir, store._table.rootdir)
+        self.assertEqual(self.source._day_bars[0]._converter, "converter")
+        self.assertEqual(self.source._dates_indexes, {})
+
+    def test_other_files(self):
+        store = self.source._day_bars[0]
+        with open(os.path.join(self.root, "yield_curve.bcolz"), "wb") as f:
+            f.write(b"0")
+        self.source._check_bundle()
+        self.assertIs(self.source._day_bars[0], store)
+
+
+if __name__ == "__main__":
+    unittest.main()
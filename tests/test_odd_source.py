@@ -0,0 +1,177 @@
+# encoding: utf-8
+import unittest
+from datetime import date, datetime
+
+import numpy as np
+from rqalpha.data.adjust import adjust_bars
+from rqalpha.interface import AbstractDataSource
+from rqalpha.utils.datetime_func import convert_date_to_int
+
+from rqalpha_mod_fxdayu_source.data_source.common.cache import CacheLRU
+from tests.common.memory import CODES, DAYS, FIELDS, MemoryInstrument, MemoryOddSource, make_bars, make_ex_factors, \
+    session_minutes
+
+MINUTES = session_minutes(DAYS)
+
+
+class TestOddFrequencySource(unittest.TestCase):
+    def setUp(self):
+        self.instruments = [MemoryInstrument(code) for code in CODES]
+        self.bars = {(code, "1m"): make_bars(MINUTES, seed=n) for n, code in enumerate(CODES)}
+
+    def source(self, cached=True):
+        source = MemoryOddSource(self.bars, DAYS)
+        source.RESAMPLE_CACHE = cached
+        return source
+
+    def assert_same_history(self, cached, frequency, bar_count, minutes):
+        uncached = self.source(cached=False)
+        for dt in minutes:
+            for instrument in self.instruments:
+                expected = uncached.history_bars(instrument, bar_count, frequency, None, dt, adjust_type="none")
+                bars = cached.history_bars(instrument, bar_count, frequency, None, dt, adjust_type="none")
+                np.testing.assert_array_equal(bars, expected)
+
+    def test_resample_cache(self):
+        source = self.source()
+        self.assert_same_history(source, "5m", 20, MINUTES[100:400])
+        self.assertEqual(len(source._memos), len(CODES))
+        self.assert_same_history(source, "15m", 10, MINUTES[300:500])
+        self.assertEqual(len(source._memos), 2 * len(CODES))
+
+    def test_resample_cache_bounded(self):
+        source = self.source()
+        source.history_bars(self.instruments[0], 20, "5m", None, MINUTES[200], adjust_type="none")
+        # room for the buckets of one instrument only
+        source._memos = CacheLRU(source._memos.space)
+        self.assert_same_history(source, "5m", 20, MINUTES[200:300])
+        self.assertLessEqual(source._memos.space, source._memos.max_space)
+        self.assertEqual(len(source._memos), 1)
+
+    def test_resample_cache_mixed_bar_count(self):
+        source = self.source()
+        # buckets memoized from the first minute bar with a short window
+        self.assert_same_history(source, "5m", 1, MINUTES[5:60])
+        self.assert_same_history(source, "5m", 40, MINUTES[60:70])
+        self.assert_same_history(source, "5m", 3, MINUTES[70:200])
+        self.assert_same_history(source, "5m", 20, MINUTES[200:210])
+
+    def test_resampled_bar(self):
+        # 000002.XSHE is suspended on the third day
+        suspended = self.bars[(CODES[1], "1m")]
+        self.bars[(CODES[1], "1m")] = suspended[(suspended["datetime"] // 1000000 != 20180104)]
+        source = self.source()
+        uncached = self.source(cached=False)
+        for frequency in ["5m", "30m", "1h"]:
+            for dt in MINUTES[200:]:
+                for instrument in self.instruments:
+                    expected = uncached._history_resampled_bars(instrument, frequency, dt, 1)[-1]
+                    bar = source._get_resampled_bar(instrument, frequency, dt)[-1]
+                    self.assertEqual(bar["datetime"], expected["datetime"])
+                    # volumes are summed up minute by minute
+                    np.testing.assert_allclose(list(bar)[1:], list(expected)[1:])
+
+
+class TestAdjustMemo(unittest.TestCase):
+    def setUp(self):
+        self.instrument = MemoryInstrument(CODES[0])
+        self.bars = make_bars(MINUTES)
+        self.source = MemoryOddSource({(CODES[0], "1m"): self.bars}, DAYS,
+                                      {CODES[0]: make_ex_factors((20180104000000, 1.1))})
+
+    def assert_fresh(self, end, bar_count, adjust_orig, fields=None):
+        ex_factors = self.source.get_ex_cum_factor(CODES[0])
+        bars = self.source.history_bars(self.instrument, bar_count, "1m", fields, MINUTES[end],
+                                        adjust_type="pre", adjust_orig=adjust_orig)
+        expected = adjust_bars(self.bars[end + 1 - bar_count:end + 1], ex_factors, fields, "pre", adjust_orig)
+        np.testing.assert_array_equal(bars, expected)
+
+    def test_adjust_memo(self):
+        for end in range(400, 600):
+            self.assert_fresh(end, 300, DAYS[2])
+        self.assertEqual(len(self.source._memos), 1)
+        self.assertLessEqual(self.source._memos.space, self.source._memos.max_space)
+        self.assert_fresh(600, 300, DAYS[2], "close")
+
+    def test_base_rate_changed(self):
+        self.assert_fresh(400, 300, DAYS[1])
+        self.assert_fresh(401, 300, DAYS[2])
+        self.assert_fresh(402, 300, DAYS[1])
+
+    def test_ex_factors_changed(self):
+        self.assert_fresh(700, 300, DAYS[3])
+        # a new ex date in the past keeps the base adjust rate of the latest day
+        self.source.ex_factors[CODES[0]] = make_ex_factors((20180103000000, 1.05), (20180104000000, 1.1))
+        self.assert_fresh(701, 300, DAYS[3])
+        self.source.ex_factors[CODES[0]] = make_ex_factors((20180103000000, 1.05), (20180105000000, 1.2))
+        self.assert_fresh(702, 300, DAYS[3])
+
+
+class MemoryDaySource(AbstractDataSource):
+    """
+    Daily bars read the same way as rqalpha's BaseDataSource.
+    """
+    day_bars = None
+
+    def _day_bars_before(self, instrument, dt):
+        bars = self.day_bars[instrument.order_book_id]
+        return bars[:bars["datetime"].searchsorted(np.uint64(convert_date_to_int(dt)), side="right")]
+
+    def get_bar(self, instrument, dt, frequency):
+        if frequency != "1d":
+            raise NotImplementedError
+        bars = self._day_bars_before(instrument, dt)
+        if len(bars) and bars["datetime"][-1] == convert_date_to_int(dt):
+            return bars[-1]
+
+    def history_bars(self, instrument, bar_count, frequency, fields, dt,
+                     skip_suspended=True, include_now=False,
+                     adjust_type='pre', adjust_orig=None):
+        if frequency != "1d":
+            raise NotImplementedError
+        bars = self._day_bars_before(instrument, dt)[-bar_count:]
+        return bars if fields is None else bars[fields]
+
+
+class MemoryMinuteSource(MemoryOddSource, MemoryDaySource):
+    pass
+
+
+class TestDayFrequencies(unittest.TestCase):
+    def setUp(self):
+        self.days = [date(2018, 1, d) for d in (2, 3, 4, 5, 8, 9, 10, 11, 12)]
+        self.instrument = MemoryInstrument(CODES[0])
+        self.day_bars = make_bars([datetime.combine(day, datetime.min.time()) for day in self.days],
+                                  fields=FIELDS + ["limit_up", "limit_down", "total_turnover"])
+        self.source = MemoryMinuteSource({(CODES[0], "1m"): make_bars(session_minutes(self.days))}, self.days)
+        self.source.day_bars = {CODES[0]: self.day_bars}
+        self.dt = datetime(2018, 1, 10, 10, 0)
+
+    def test_day(self):
+        bars = self.source.history_bars(self.instrument, 3, "1d", None, self.dt, adjust_type="none")
+        np.testing.assert_array_equal(bars, self.day_bars[4:7])
+        bars = self.source.history_bars(self.instrument, 3, "1d", ["close", "limit_up"], self.dt,
+                                        adjust_type="none")
+        np.testing.assert_array_equal(bars, self.day_bars[4:7][["close", "limit_up"]])
+        bar = self.source.get_bar(self.instrument, self.dt, "1d")
+        self.assertEqual(bar["limit_down"], self.day_bars[6]["limit_down"])
+        self.assertEqual(bar["total_turnover"], self.day_bars[6]["total_turnover"])
+
+    def test_include_now(self):
+        days = self.day_bars
+        for include_now in (False, True):
+            bars = self.source.history_bars(self.instrument, 2, "2d", None, self.dt, include_now=include_now,
+                                            adjust_type="none")
+            # buckets of 2018-01-08 and 2018-01-09, 2018-01-10 and 2018-01-11 which is still in progress
+            np.testing.assert_array_equal(bars["datetime"], days["datetime"][[5, 6]])
+            self.assertEqual(bars["open"][0], days["open"][4])
+            self.assertEqual(bars["close"][-1], days["close"][6])
+            bars = self.source.history_bars(self.instrument, 2, "1w", None, self.dt, include_now=include_now,
+                                            adjust_type="none")
+            np.testing.assert_array_equal(bars["datetime"], days["datetime"][[3, 6]])
+            self.assertEqual(bars["volume"][-1], days["volume"][4:7].sum())
+        self.assertEqual(self.source.get_bar(self.instrument, self.dt, "1w")["close"], days["close"][6])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+# encoding: utf-8
+import unittest
+from collections import OrderedDict
+from unittest import mock
+
+import numpy as np
+
+from rqalpha_mod_fxdayu_source.data_source.common.minite import MiniteBarDataSourceMixin
+from tests.common.memory import CODES, DAYS, FIELDS, MemoryInstrument, MemoryOddSource, make_bars, make_ex_factors, \
+    session_minutes
+
+MINUTES = session_minutes(DAYS)
+
+
+class MemoryBatchSource(MemoryOddSource, MiniteBarDataSourceMixin):
+    """
+    MemoryOddSource queried through raw_history_bars_batch, as the minute bar data sources are.
+    """
+
+    def __init__(self, *args, **kwargs):
+        # the bundle of BaseDataSource is not needed
+        with mock.patch.object(MiniteBarDataSourceMixin, "__init__", lambda self: None):
+            super(MemoryBatchSource, self).__init__(*args, **kwargs)
+
+    def _async_raw_history_bars(self, *args, **kwargs):
+        # read by raw_history_bars of the class
+        return None
+
+
+class TestHistoryBarsPanel(unittest.TestCase):
+    def setUp(self):
+        self.instruments = [MemoryInstrument(code) for code in CODES]
+        bars = {(code, "1m"): make_bars(MINUTES, seed=n) for n, code in enumerate(CODES)}
+        # 000002.XSHE is suspended on the third day
+        suspended = bars[(CODES[1], "1m")]
+        bars[(CODES[1], "1m")] = suspended[suspended["datetime"] // 1000000 != 20180104]
+        ex_factors = {CODES[0]: make_ex_factors((20180104000000, 1.1)),
+                      CODES[1]: make_ex_factors((20180103000000, 1.2), (20180105000000, 1.5))}
+        self.source = MemoryOddSource(bars, DAYS, ex_factors)
+
+    def assert_panel(self, panel, bar_count, frequency, dt, adjust_type, fields=FIELDS):
+        self.assertEqual(list(panel), ["datetime"] + fields)
+        for n, instrument in enumerate(self.instruments):
+            bars = self.source.history_bars(instrument, bar_count, frequency, None, dt,
+                                            adjust_type=adjust_type, adjust_orig=DAYS[-1])
+            bars = bars[np.in1d(bars["datetime"], panel["datetime"])]
+            pos = panel["datetime"].searchsorted(bars["datetime"])
+            missing = np.ones(len(panel["datetime"]), dtype=bool)
+            missing[pos] = False
+            for field in fields:
+                np.testing.assert_allclose(panel[field][pos, n], bars[field])
+                self.assertTrue(np.isnan(panel[field][missing, n]).all())
+
+    def test_panel(self):
+        for frequency, dt in [("1m", MINUTES[500]), ("5m", MINUTES[500]), ("15m", MINUTES[700])]:
+            for adjust_type in ("none", "pre"):
+                panel = self.source.history_bars_panel(self.instruments, 30, frequency, None, dt,
+                                                       adjust_type=adjust_type, adjust_orig=DAYS[-1])
+                self.assertEqual(len(panel["datetime"]), 30)
+                self.assertEqual(panel["close"].shape, (30, len(CODES)))
+                self.assert_panel(panel, 30, frequency, dt, adjust_type)
+        # the suspended minutes are left out by history_bars but kept as nan in the panel
+        panel = self.source.history_bars_panel(self.instruments, 30, "1m", "close", MINUTES[520],
+                                               adjust_type="none")
+        self.assertEqual(list(panel), ["datetime", "close"])
+        self.assertTrue(np.isnan(panel["close"][:, 1]).all())
+        self.assertFalse(np.isnan(panel["close"][:, [0, 2]]).any())
+
+    def test_adjust_panel(self):
+        dt = MINUTES[-1]
+        panel = self.source.history_bars_panel(self.instruments, 600, "1m", None, dt, adjust_type="none")
+        expected = self.source.history_bars_panel(self.instruments, 600, "1m", None, dt,
+                                                  adjust_type="pre", adjust_orig=DAYS[-1])
+        copied = OrderedDict((key, value.copy()) for key, value in panel.items())
+        adjusted = self.source._adjust_panel(self.instruments, copied, "pre", DAYS[-1])
+        for field in ["datetime"] + FIELDS:
+            np.testing.assert_allclose(adjusted[field], expected[field])
+        # the price of 000002.XSHE is scaled by 1.2 / 1.5 before 2018-01-05, volume the other way round
+        before = panel["datetime"] < 20180105000000
+        np.testing.assert_allclose(adjusted["close"][before, 1], panel["close"][before, 1] * 1.2 / 1.5)
+        np.testing.assert_allclose(adjusted["volume"][before, 1], panel["volume"][before, 1] * 1.5 / 1.2)
+        np.testing.assert_allclose(adjusted["close"][~before, 1], panel["close"][~before, 1])
+        self.assertIs(self.source._adjust_panel(self.instruments, panel, "none", DAYS[-1]), panel)
+
+    def test_batch(self):
+        source = MemoryBatchSource(self.source.memory.bars, DAYS, self.source.ex_factors)
+        with mock.patch.object(source, "raw_history_bars_batch", wraps=source.raw_history_bars_batch) as batch:
+            for adjust_type in ("none", "pre"):
+                panel = source.history_bars_panel(self.instruments, 30, "1m", None, MINUTES[500],
+                                                  adjust_type=adjust_type, adjust_orig=DAYS[-1])
+                self.assert_panel(panel, 30, "1m", MINUTES[500], adjust_type)
+            # all instruments are queried in one batch, and not again one by one
+            self.assertEqual(batch.call_count, 2)
+            self.assertEqual(len(source.memory.calls), 2 * len(CODES))
+            # odd frequencies are resampled from the minute bars one by one
+            source.history_bars_panel(self.instruments, 30, "5m", None, MINUTES[500], adjust_type="none")
+            self.assertEqual(batch.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
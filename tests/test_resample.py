@@ -0,0 +1,110 @@
+# encoding: utf-8
+import unittest
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from rqalpha.utils.datetime_func import convert_dt_to_int, convert_int_to_datetime
+
+from rqalpha_mod_fxdayu_source.share.trading_session import ASTOCK_TRADING_SESSION
+from rqalpha_mod_fxdayu_source.utils import InDayTradingPointIndexer
+from rqalpha_mod_fxdayu_source.utils.resample import fill_suspended_bars, get_bar_count_table, get_resample_labels, \
+    get_session_grid, resample_bars
+
+DTYPE = [("datetime", np.uint64), ("open", np.float64), ("high", np.float64), ("low", np.float64),
+         ("close", np.float64), ("volume", np.float64)]
+
+
+def make_minute_bars(days=5):
+    dts = []
+    for n in range(days):
+        day = datetime(2018, 1, 2) + timedelta(days=n)
+        for start, count in ((day.replace(hour=9, minute=31), 120), (day.replace(hour=13, minute=1), 120)):
+            dts.extend(start + timedelta(minutes=i) for i in range(count))
+    rng = np.random.RandomState(0)
+    bars = np.empty((len(dts),), dtype=DTYPE)
+    bars["datetime"] = [convert_dt_to_int(dt) for dt in dts]
+    for field in ["open", "high", "low", "close", "volume"]:
+        bars[field] = rng.rand(len(dts))
+    return bars
+
+
+def pandas_resample_bars(bars, frequency):
+    df = pd.DataFrame(bars)
+    df["datetime"] = df["datetime"].apply(convert_int_to_datetime)
+    df = df.set_index(df["datetime"].values)
+    group = df.resample(frequency[:-1] + "min", closed="right", label="right")
+    result = pd.DataFrame()
+    result["high"] = group["high"].max().dropna()
+    result["low"] = group["low"].min().dropna()
+    result["close"] = group["close"].last().dropna()
+    result["open"] = group["open"].first().dropna()
+    result["volume"] = group["volume"].sum().dropna()
+    result["datetime"] = group["datetime"].last().dropna().apply(convert_dt_to_int)
+    return result.reset_index(drop=True)
+
+
+class TestResample(unittest.TestCase):
+    def setUp(self):
+        self.bars = make_minute_bars()
+
+    def test_same_as_pandas(self):
+        for frequency in ["5m", "15m", "30m", "60m"]:
+            for start in [0, 7, 133]:
+                bars = self.bars[start:]
+                result = resample_bars(bars, frequency)
+                expected = pandas_resample_bars(bars, frequency)
+                self.assertEqual(len(result), len(expected))
+                for field in ["datetime", "open", "high", "low", "close", "volume"]:
+                    np.testing.assert_allclose(result[field], expected[field].values)
+
+    def test_hour(self):
+        np.testing.assert_array_equal(resample_bars(self.bars, "1h"), resample_bars(self.bars, "60m"))
+
+    def test_session(self):
+        bars = self.bars[:240]
+        for frequency in ["5m", "7m", "45m", "60m"]:
+            result = resample_bars(bars, frequency, ASTOCK_TRADING_SESSION)
+            points = sorted(InDayTradingPointIndexer.get_a_stock_trading_points(date(2018, 1, 2), frequency))
+            np.testing.assert_array_equal(result["datetime"], [convert_dt_to_int(point) for point in points])
+            np.testing.assert_allclose(result["volume"].sum(), bars["volume"].sum())
+
+    def test_bar_count_table(self):
+        for frequency, num in [("1m", 1), ("5m", 5), ("7m", 7), ("60m", 60)]:
+            table = get_bar_count_table(ASTOCK_TRADING_SESSION, num)
+            points = InDayTradingPointIndexer.get_a_stock_trading_points(date(2018, 1, 2), frequency)
+            self.assertEqual(table[-1], len(points))
+            self.assertEqual(table[9 * 60 + 30], 0)
+            # nothing traded during the noon break
+            self.assertEqual(table[13 * 60], table[11 * 60 + 30])
+        self.assertEqual(get_bar_count_table(ASTOCK_TRADING_SESSION, 1)[10 * 60 + 30], 60)
+
+    def test_fill_suspended(self):
+        # suspended in the afternoon of the second day and the whole third day
+        bars = np.concatenate([self.bars[:360], self.bars[480:]])
+        result = resample_bars(bars, "30m", ASTOCK_TRADING_SESSION)
+        labels = get_resample_labels(result["datetime"], 30, ASTOCK_TRADING_SESSION)
+        grid_labels, grid_datetimes = get_session_grid([20180102, 20180103, 20180104, 20180105, 20180106],
+                                                       ASTOCK_TRADING_SESSION, 30)
+        filled = fill_suspended_bars(result, labels, grid_labels, grid_datetimes)
+        np.testing.assert_array_equal(filled["datetime"], grid_datetimes)
+        expected = resample_bars(self.bars, "30m", ASTOCK_TRADING_SESSION)
+        suspended = filled["volume"] == 0
+        self.assertEqual(suspended.sum(), 4)
+        np.testing.assert_array_equal(filled[~suspended], expected[~suspended])
+        np.testing.assert_array_equal(filled["open"][suspended], filled["close"][11])
+        np.testing.assert_array_equal(filled["close"][suspended], filled["close"][11])
+
+    def test_history_window(self):
+        # the window history_bars resamples for bar_count=20, starting in the middle of a bucket
+        for frequency, num in [("5m", 5), ("15m", 15), ("30m", 30)]:
+            bars = self.bars[-21 * num - 3:]
+            result = resample_bars(bars, frequency)
+            expected = pandas_resample_bars(bars, frequency)
+            self.assertEqual(len(result), len(expected))
+            for field in ["datetime", "open", "high", "low", "close", "volume"]:
+                np.testing.assert_allclose(result[field], expected[field].values)
+
+
+if __name__ == '__main__':
+    unittest.main()